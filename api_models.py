@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional, the v2 endpoints fall back to the standard JSON response.
+    orjson = None
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    # Response class of the v2 endpoints, orjson serialises big files_found/sequences listings several times faster.
+    def render(self, content):
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def model_data(model):
+    # Plain dict of a model on Pydantic 1 and 2.
+    if hasattr(model, "model_dump"):
+        return model.model_dump()
+    return model.dict()
+
+
+class WorkspaceRequest(BaseModel):
+    # The fields are joined in this order into the workspace path.
+    project: str
+    sequence: str
+    shot: str
+    department: str
+    user: str
+
+
+class WorkspaceResponse(BaseModel):
+    result: bool
+    destination: Optional[str] = None
+    template_used: Optional[str] = None
+    template_stats: Optional[Dict[str, Any]] = None  # Clone mode, files per strategy and timings.
+    error: Optional[str] = None
+
+
+class FilesRequest(BaseModel):
+    search_path: str
+    folders_to_search: str
+    refresh: bool = False  # Ignore the scan index.
+
+
+class FilesResponse(BaseModel):
+    search_path: str
+    files_found: List[Any]  # (first, last) pairs for sequences, plain names for single files.
+    sequences: List[Dict[str, Any]]  # Frame ranges, holes, padding and sizes per sequence.
+    cached: bool  # True when the listing came from the scan index.
+
+
+class IngestRequest(BaseModel):
+    project: str
+    sequence: str
+    shot: str
+    department: str
+    type: str
+    is_sequence: bool
+    src_path: str
+    extension: str
+    naming_scheme: str
+    versioning: bool = True
+    user: str = "pipeline"
+    ext: Optional[str] = None  # Extension of a single file ingest, defaults to extension.
+    dedup: Optional[str] = None  # One of ingest_manifest.DEDUP_MODES, defaults to INGEST_DEDUP.
+    verify: Optional[str] = None  # One of ingest_manifest.VERIFY_MODES, defaults to INGEST_VERIFY.
+    frames: Optional[str] = None  # One of sequence_scanner.FRAME_MODES, defaults to INGEST_FRAME_MODE.
+
+
+class IngestResponse(BaseModel):
+    result: bool
+    destination_path: Optional[str] = None
+    source_path: Optional[str] = None
+    error: Optional[str] = None
+    dedup: Optional[Dict[str, Any]] = None
+    verification: Optional[Dict[str, Any]] = None
+    ignored_files: List[str] = []
+    copy_stats: Optional[Dict[str, Any]] = None
+
+
+class IngestBatchRequest(BaseModel):
+    # A malformed item rejects the whole v2 batch with a 422, /ingest_batch fails bad items one by one instead.
+    items: List[IngestRequest]
+
+
+class IngestBatchResponse(BaseModel):
+    results: List[IngestResponse]
+    copy_stats: Optional[Dict[str, Any]] = None
@@ -0,0 +1,499 @@
+"""
+End-to-end benchmark of the chat-to-ingest chain: Pipeline.pipe against the real fastapi_helper app.
+
+Ollama is replaced by a local stand-in that answers every prompt in prompts/ with a canned reply after a fixed
+latency, so the numbers measure the pipeline rather than a model. The app runs under uvicorn on a generated
+temp tree (plate sequences of each --frames size and a deep fx template), mapped in through STORAGE_ROOTS.
+
+Reports p50/p95 turn latency for a chat, a setup and an ingest message, ingest throughput and scan time per
+sequence size, and workspace creation time. --output saves the results as JSON, --baseline compares them with
+an earlier run and exits with 1 when anything got worse by more than --tolerance.
+
+Usage: python benchmarks/bench_end_to_end.py [--frames 100 1000 10000] [--turns 20] [--llm-latency 0.05]
+                                             [--output results.json] [--baseline previous.json]
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import socket
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROJECT = "PROJ_BENCH"
+SEQUENCE = "SEQ010"
+MESSAGES = {
+    "chat": "What focal length would you use for a close up portrait?",
+    "setup": "Please set up SH0010 in {sequence} of {project} for the fx department for Alice",
+    "ingest": "Can you ingest the plates for {project} {sequence} {shot}",
+}
+
+
+def shot_name(frames):
+    return f"SH{frames:06d}"
+
+
+def ingest_payload(project, sequence, shot):
+    # What the extraction prompt is expected to produce for a plate folder under the "temp" root.
+    return {"project": project, "sequence": sequence, "shot": shot, "department": "plate", "type": "plate",
+            "is_sequence": True, "src_path": f"T:/{project}/{sequence}/{shot}/ingest/plate", "extension": "exr",
+            "naming_scheme": "plate", "versioning": True, "user": "bench"}
+
+
+class FakeOllama:
+    """
+    Ollama stand-in serving /api/version and /api/chat.
+
+    A chat message is matched to the prompt in prompts/ it starts with and answered with a canned reply
+    for the project, sequence and shot named in the user's part of the message, after latency seconds.
+    Anything else (summaries, forwarded chat) gets a short free-form reply.
+    """
+
+    PROJECT_PATTERN = re.compile(r"\b(PROJ_\w+)")
+    SEQUENCE_PATTERN = re.compile(r"\b(SEQ\d+)")
+    SHOT_PATTERN = re.compile(r"\b(SH\d+)")
+
+    def __init__(self, prompts_dir, latency=0.05):
+        self.latency = latency
+        self.prompts = []  # (prompt name, text), longest first so no prompt is mistaken for one it starts with.
+        for file_name in os.listdir(prompts_dir):
+            with open(os.path.join(prompts_dir, file_name), "r") as f:  # Text mode, like the server reads them.
+                self.prompts.append((os.path.splitext(file_name)[0], f.read()))
+        self.prompts.sort(key=lambda prompt: len(prompt[1]), reverse=True)
+        self.calls = 0
+        self.server = None
+
+    def answer(self, message):
+        for name, text in self.prompts:
+            if message.startswith(text):
+                return self.canned(name, message[len(text):].strip())
+        return "All done, the request was processed."
+
+    def canned(self, name, message):
+        intent = None
+        if re.search(r"ingest", message, re.IGNORECASE):
+            intent = "ingestion"
+        elif re.search(r"set\s?up", message, re.IGNORECASE):
+            intent = "setup"
+        project = self._find(self.PROJECT_PATTERN, message, PROJECT)
+        sequence = self._find(self.SEQUENCE_PATTERN, message, SEQUENCE)
+        shot = self._find(self.SHOT_PATTERN, message, "SH0010")
+        if name == "relevance_prompt":
+            return "True" if intent else "False"
+        if name == "user_intent":
+            return intent or "unsure"
+        if name == "route_prompt":
+            return json.dumps({"relevant": intent is not None, "intent": intent or "unsure"})
+        if name == "setup_prompt":
+            return json.dumps({"project": project, "sequence": sequence, "shot": shot, "department": "fx",
+                               "user": "Alice"})
+        if name == "ingestion_prompt":
+            return json.dumps({"request1": {"project": project, "sequence": sequence, "shot": shot,
+                                            "ingestion": ["plate"]}})
+        if name == "extract_ingestion_prompt":
+            return json.dumps(ingest_payload(project, sequence, shot))
+        return "All done, the request was processed."
+
+    @staticmethod
+    def _find(pattern, message, default):
+        match = pattern.search(message)
+        return match.group(1) if match else default
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real server.
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self.reply({"version": "0.0.0-bench"})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                message = request["messages"][-1]["content"]
+                content = fake.answer(message)
+                fake.calls += 1
+                time.sleep(fake.latency)
+                done = {"model": request.get("model"), "created_at": "2024-01-01T00:00:00Z", "done": True,
+                        "done_reason": "stop", "prompt_eval_count": len(message.split()),
+                        "eval_count": len(content.split())}
+                if not request.get("stream", True):
+                    self.reply({**done, "message": {"role": "assistant", "content": content}})
+                    return
+                # Streamed replies are NDJSON, one part per word and the token counts on the last one.
+                parts = [{"model": request.get("model"), "created_at": done["created_at"], "done": False,
+                          "message": {"role": "assistant", "content": word}}
+                         for word in re.findall(r"\S+\s*", content)]
+                parts.append({**done, "message": {"role": "assistant", "content": ""}})
+                self.reply_raw("".join(json.dumps(part) + "\n" for part in parts).encode(), "application/x-ndjson")
+
+            def reply(self, data):
+                self.reply_raw(json.dumps(data).encode(), "application/json")
+
+            def reply_raw(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def make_plate_folders(temp_root, sizes, frame_kb):
+    # {temp}/PROJ_BENCH/SEQ010/SH{frames}/ingest/plate/plate_main.{frame}.exr for each size, plus a loose file.
+    block = os.urandom(frame_kb * 1024)
+    past = time.time() - 60
+    for frames in sizes:
+        folder = os.path.join(temp_root, PROJECT, SEQUENCE, shot_name(frames), "ingest", "plate")
+        os.makedirs(folder)
+        for frame in range(1001, 1001 + frames):
+            with open(os.path.join(folder, f"plate_main.{frame:04d}.exr"), "wb") as f:
+                f.write(block)
+        open(os.path.join(folder, "notes.txt"), "w").close()
+        # Old enough for the scan index to trust its mtime straight away.
+        os.utime(folder, (past, past))
+
+
+def make_template(folder, depth, breadth, files):
+    # A department template breadth folders wide and depth folders deep, with files in every folder.
+    folders = [folder]
+    for _ in range(depth + 1):
+        next_folders = []
+        for parent in folders:
+            os.makedirs(parent, exist_ok=True)
+            for index in range(files):
+                with open(os.path.join(parent, f"config_{index:02d}.json"), "w") as f:
+                    f.write('{"department": "fx", "index": %d}\n' % index)
+            next_folders.extend(os.path.join(parent, f"task_{index}") for index in range(breadth))
+        folders = next_folders
+    return sum(breadth ** level for level in range(depth + 1)) * files
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarise(seconds):
+    return {"count": len(seconds),
+            "p50_ms": round(percentile(seconds, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(seconds, 0.95) * 1000, 2),
+            "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2),
+            "min_ms": round(min(seconds) * 1000, 2),
+            "max_ms": round(max(seconds) * 1000, 2)}
+
+
+def parse_server_timing(header):
+    stages = {}
+    for timing in (header or "").split(","):
+        stage, _, milliseconds = timing.strip().partition(";dur=")
+        if stage and milliseconds:
+            stages[stage] = stages.get(stage, 0.0) + float(milliseconds)
+    return stages
+
+
+def start_app(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="fastapi-app", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("The FastAPI app did not start.")
+        time.sleep(0.05)
+    return server, thread
+
+
+def run_turns(pipeline, message, turns, stream, quiet):
+    # Seconds per Pipeline.pipe call, including reading the whole reply when it streams.
+    seconds = []
+    for _ in range(turns):
+        with quiet():
+            started = time.perf_counter()
+            reply = pipeline.pipe(message, "bench", [{"role": "user", "content": message}], {"stream": stream})
+            if not isinstance(reply, str):
+                reply = "".join(reply)
+            seconds.append(time.perf_counter() - started)
+    return seconds, reply
+
+
+def run_ingests(client, frames, repeat, quiet):
+    # Ingests the plate of one size repeat times straight through /v2/ingest_request, each into a new version.
+    runs = []
+    for _ in range(repeat):
+        with quiet():
+            started = time.perf_counter()
+            response = client.post("/v2/ingest_request", json=ingest_payload(PROJECT, SEQUENCE, shot_name(frames)))
+            seconds = time.perf_counter() - started
+        response.raise_for_status()
+        result = response.json()
+        if not result["result"]:
+            raise RuntimeError(f"Ingest of {frames} frames failed: {result['error']}")
+        runs.append((seconds, result["copy_stats"], parse_server_timing(response.headers.get("Server-Timing"))))
+    seconds = [run[0] for run in runs]
+    copy_stats = [run[1] for run in runs]
+    return {"frames": frames,
+            **summarise(seconds),
+            "files_per_second": round(percentile([stats["files_per_second"] for stats in copy_stats], 0.5), 1),
+            "mb_per_second": round(percentile([stats["mb_per_second"] for stats in copy_stats], 0.5), 2),
+            "bytes": copy_stats[-1]["bytes"],
+            "server_stages_ms": {stage: round(ms, 2) for stage, ms in runs[-1][2].items()}}
+
+
+def run_scans(client, frames, repeat, quiet):
+    # Full rescans (refresh) against answers from the scan index, of the same plate folder.
+    request = {"search_path": f"T:\\{PROJECT}\\{SEQUENCE}\\{shot_name(frames)}\\ingest",
+               "folders_to_search": "plate"}
+    timings = {True: [], False: []}
+    cached = []
+    for _ in range(repeat):
+        for refresh in (True, False):
+            with quiet():
+                started = time.perf_counter()
+                response = client.post("/v2/get_files_folders", json={**request, "refresh": refresh})
+                timings[refresh].append(time.perf_counter() - started)
+            response.raise_for_status()
+            if not refresh:
+                cached.append(response.json()["cached"])
+    return {"frames": frames,
+            "rescan_p50_ms": round(percentile(timings[True], 0.5) * 1000, 2),
+            "indexed_p50_ms": round(percentile(timings[False], 0.5) * 1000, 2),
+            "indexed_hits": sum(cached), "indexed_requests": len(cached)}
+
+
+def run_workspaces(client, repeat, quiet):
+    seconds = []
+    template_seconds = []
+    for index in range(repeat):
+        with quiet():
+            started = time.perf_counter()
+            response = client.post("/v2/create_workspace", json={"project": PROJECT, "sequence": SEQUENCE,
+                                                                 "shot": "SH9999", "department": "fx",
+                                                                 "user": "bench"})
+            seconds.append(time.perf_counter() - started)
+        response.raise_for_status()
+        result = response.json()
+        if not result["result"]:
+            raise RuntimeError(f"Workspace creation failed: {result['error']}")
+        template_seconds.append(result["template_stats"]["seconds"])
+    return {**summarise(seconds), "template_p50_ms": round(percentile(template_seconds, 0.5) * 1000, 2)}
+
+
+def server_stage_means(metrics_page):
+    # Mean milliseconds per stage from the vfx_stage_seconds histogram of the app's /metrics.
+    sums, counts = {}, {}
+    for line in metrics_page.splitlines():
+        match = re.match(r'vfx_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)', line)
+        if match:
+            (sums if match.group(1) == "sum" else counts)[match.group(2)] = float(match.group(3))
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sums if counts.get(stage)}
+
+
+def flatten(results):
+    # metric name -> (value, True if higher is better), for the baseline comparison.
+    metrics = {}
+    for scenario, stats in results["turns"].items():
+        metrics[f"turn {scenario} p50 ms"] = (stats["p50_ms"], False)
+        metrics[f"turn {scenario} p95 ms"] = (stats["p95_ms"], False)
+    for stats in results["ingest"]:
+        metrics[f"ingest {stats['frames']} frames MB/s"] = (stats["mb_per_second"], True)
+        metrics[f"ingest {stats['frames']} frames p50 ms"] = (stats["p50_ms"], False)
+    for stats in results["scan"]:
+        metrics[f"scan {stats['frames']} frames rescan ms"] = (stats["rescan_p50_ms"], False)
+        metrics[f"scan {stats['frames']} frames indexed ms"] = (stats["indexed_p50_ms"], False)
+    if results.get("workspace"):
+        metrics["workspace p50 ms"] = (results["workspace"]["p50_ms"], False)
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    # Prints every metric next to the baseline's, returns the names of the ones that got worse than tolerance.
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<36} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous or not previous[name][0]:
+            continue
+        change = (value - previous[name][0]) / previous[name][0]
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<36} {previous[name][0]:>12.2f} {value:>12.2f} {change * 100:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Plate sizes to generate, e.g. 100 1000 10000 100000.")
+    parser.add_argument("--frame-kb", type=int, default=64, help="Size of each generated frame.")
+    parser.add_argument("--turn-frames", type=int, help="Plate size the ingest turns use, default the smallest.")
+    parser.add_argument("--template-depth", type=int, default=4)
+    parser.add_argument("--template-breadth", type=int, default=3)
+    parser.add_argument("--template-files", type=int, default=5, help="Files in every template folder.")
+    parser.add_argument("--turns", type=int, default=20, help="Pipeline.pipe calls per message.")
+    parser.add_argument("--repeat", type=int, default=3, help="Direct ingests, scans and workspaces per size.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the fake Ollama takes per reply.")
+    parser.add_argument("--stream", action="store_true", help="Ask for streamed replies.")
+    parser.add_argument("--valve", action="append", default=[], metavar="NAME=VALUE",
+                        help="Pipeline valve for the run, e.g. ROUTING_MODE=combined. Can be repeated.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results JSON of an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated temp tree.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline and server output.")
+    args = parser.parse_args()
+    turn_frames = args.turn_frames or min(args.frames)
+    if turn_frames not in args.frames:
+        parser.error("--turn-frames has to be one of --frames.")
+
+    def quiet():
+        # The pipeline and the app print every payload, which would swamp the results and slow them down.
+        return contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    directory = tempfile.mkdtemp(prefix="e2e_bench_")
+    temp_root = os.path.join(directory, "temp")
+    project_root = os.path.join(directory, "projects")
+    fake_ollama = FakeOllama(os.path.join(ROOT, "prompts"), args.llm_latency)
+    app_server = app_thread = pipeline = None
+    try:
+        started = time.perf_counter()
+        make_plate_folders(temp_root, args.frames, args.frame_kb)
+        template_files = make_template(os.path.join(temp_root, "Templates", "fx"), args.template_depth,
+                                       args.template_breadth, args.template_files)
+        os.makedirs(project_root)
+        print(f"Generated {sum(args.frames)} frames and a {template_files} file template in "
+              f"{time.perf_counter() - started:.1f}s under {directory}")
+
+        # fastapi_helper and vfxHelper read their settings from the environment when they are loaded.
+        app_port = free_port()
+        os.environ.update({
+            "STORAGE_ROOTS": json.dumps({"temp": {platform.system().lower(): temp_root},
+                                         "project": {platform.system().lower(): project_root}}),
+            "SCAN_INDEX_PATH": os.path.join(directory, "scan_index.db"),
+            "JOB_DB_PATH": os.path.join(directory, "job_queue.db"),
+            "TRACE_REQUESTS": "true" if args.verbose else "false",
+            "FLASK_HOST": f"http://127.0.0.1:{app_port}",
+            "OLLAMA_HOST": fake_ollama.start(),
+            "OLLAMA_MODEL": "bench",
+            "METRICS_PORT": "0",
+            "LLM_CACHE_SIZE": "0",  # Every turn reaches Ollama, --valve LLM_CACHE_SIZE=512 measures the cache.
+            "STREAM_RESPONSES": "true",
+        })
+        for valve in args.valve:
+            name, _, value = valve.partition("=")
+            os.environ[name] = value
+        import httpx
+        import fastapi_helper
+        import vfxHelper
+
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+        app_server, app_thread = start_app(fastapi_helper.app, app_port)
+        pipeline = vfxHelper.Pipeline()
+        # Start it the way the pipelines server does, with the health monitor and a warm prompt cache.
+        pipeline.run_coroutine(pipeline.on_startup())
+
+        results = {
+            "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                     "platform": platform.platform(), "cpus": os.cpu_count(), "args": vars(args)},
+            "turns": {}, "ingest": [], "scan": [], "workspace": None,
+        }
+        messages = {"chat": MESSAGES["chat"],
+                    "setup": MESSAGES["setup"].format(project=PROJECT, sequence=SEQUENCE),
+                    f"ingest {turn_frames} frames": MESSAGES["ingest"].format(project=PROJECT, sequence=SEQUENCE,
+                                                                              shot=shot_name(turn_frames))}
+        run_turns(pipeline, messages["chat"], 1, args.stream, quiet)  # Warm up the connections.
+        calls = fake_ollama.calls
+        for scenario, message in messages.items():
+            seconds, reply = run_turns(pipeline, message, args.turns, args.stream, quiet)
+            results["turns"][scenario] = summarise(seconds)
+            print(f"turn {scenario:<22} p50 {results['turns'][scenario]['p50_ms']:9.1f} ms  "
+                  f"p95 {results['turns'][scenario]['p95_ms']:9.1f} ms  reply: {reply[:40]!r}")
+        results["llm_calls_per_turn"] = round((fake_ollama.calls - calls) / (args.turns * len(messages)), 2)
+
+        with httpx.Client(base_url=os.environ["FLASK_HOST"], timeout=3600) as client:
+            for frames in args.frames:
+                stats = run_ingests(client, frames, args.repeat, quiet)
+                results["ingest"].append(stats)
+                print(f"ingest {frames:>7} frames  p50 {stats['p50_ms']:9.1f} ms  "
+                      f"{stats['files_per_second']:9.1f} files/s  {stats['mb_per_second']:8.1f} MB/s  "
+                      f"stages {stats['server_stages_ms']}")
+            for frames in args.frames:
+                stats = run_scans(client, frames, args.repeat, quiet)
+                results["scan"].append(stats)
+                print(f"scan   {frames:>7} frames  rescan {stats['rescan_p50_ms']:9.1f} ms  "
+                      f"indexed {stats['indexed_p50_ms']:7.1f} ms  "
+                      f"({stats['indexed_hits']}/{stats['indexed_requests']} from the index)")
+            results["workspace"] = run_workspaces(client, args.repeat, quiet)
+            print(f"workspace          p50 {results['workspace']['p50_ms']:9.1f} ms  "
+                  f"template clone {results['workspace']['template_p50_ms']:.1f} ms")
+            results["server_stages_mean_ms"] = server_stage_means(client.get("/metrics").text)
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}.")
+                sys.exit(1)
+    finally:
+        if pipeline is not None:
+            pipeline.run_coroutine(pipeline.on_shutdown())
+        if app_server is not None:
+            app_server.should_exit = True
+            app_thread.join(timeout=30)
+        fake_ollama.stop()
+        if args.keep:
+            print(f"Kept {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of sequence_scanner.scan_sequences against the original listdir based get_files_in_directory.
+
+Usage: python benchmarks/bench_sequence_scan.py [--frames 10000 100000] [--repeat 5] [--directory PATH]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sequence_scanner import scan_sequences, compact_listing, np
+
+
+def legacy_get_files_in_directory(directory, extension_filter=None):
+    # The implementation get_files_in_directory had before sequence_scanner, kept here for comparison.
+    files = os.listdir(directory)
+    if extension_filter:
+        files = [file for file in files if file.endswith(extension_filter)]
+    sequences = defaultdict(list)
+    other_files = []
+    dynamic_pattern = re.compile(r"^(.*?)(\d+)(\.\w+)$")
+    for file in files:
+        match = dynamic_pattern.match(file)
+        if match:
+            sequences[(match.group(1), match.group(3))].append((int(match.group(2)), file))
+        else:
+            other_files.append(file)
+    compact_files = []
+    for (base_name, extension), frames in sequences.items():
+        frames.sort()
+        if len(frames) > 1:
+            compact_files.append((frames[0][1], frames[-1][1]))
+        else:
+            compact_files.append(frames[0][1])
+    compact_files.extend(other_files)
+    return compact_files
+
+
+def make_plate_folder(directory, frame_count, hole_every=997):
+    # One EXR plate padded to 4 digits with a dropped frame every hole_every frames, plus a few loose
+    # files. Past 10k frames the numbers outgrow the padding (9999 -> 10000), as they do on real plates.
+    # The render has a number too long for a frame, it must be listed as a plain file.
+    for frame in range(1001, 1001 + frame_count):
+        if frame % hole_every == 0:
+            continue
+        open(os.path.join(directory, f"plate_main_v0001.{frame:04d}.exr"), "wb").close()
+    for name in ("notes.txt", "plate_main_v0001.mov", "render_20240101123045123456789.exr"):
+        open(os.path.join(directory, name), "wb").close()
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(directory, repeat, label):
+    legacy = best_time(lambda: legacy_get_files_in_directory(directory), repeat)
+    scan = best_time(lambda: scan_sequences(directory, with_sizes=False), repeat)
+    scan_sizes = best_time(lambda: scan_sequences(directory, with_sizes=True), repeat)
+    result = scan_sequences(directory, with_sizes=False)
+    assert sorted(map(str, compact_listing(result))) == sorted(map(str, legacy_get_files_in_directory(directory)))
+    print(f"{label:>12}  legacy {legacy * 1000:9.2f} ms  scan {scan * 1000:9.2f} ms  "
+          f"scan+sizes {scan_sizes * 1000:9.2f} ms  speedup {legacy / scan:5.2f}x  "
+          f"sequences {len(result['sequences'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--directory", help="Benchmark an existing folder instead of generated ones.")
+    args = parser.parse_args()
+
+    print(f"numpy: {'yes' if np is not None else 'no'}")
+    if args.directory:
+        run(args.directory, args.repeat, os.path.basename(args.directory))
+        return
+    for frame_count in args.frames:
+        directory = tempfile.mkdtemp(prefix="seq_bench_")
+        try:
+            make_plate_folder(directory, frame_count)
+            run(directory, args.repeat, f"{frame_count} frames")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
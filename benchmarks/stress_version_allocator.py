@@ -0,0 +1,95 @@
+"""
+Stress test of version_allocator: many threads and processes claim versions of the same folder at once.
+
+Every claim must get its own vXXXX folder and the versions must run from v0001 without gaps.
+Also times a claim against the old listdir + regex lookup on a folder that already has many versions.
+
+Usage: python benchmarks/stress_version_allocator.py [--processes 4] [--threads 8] [--claims 25] [--existing 2000]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from version_allocator import VersionAllocator, format_version
+
+
+def legacy_next_version(folder):
+    # The lookup create_workspace and ingest_request had before version_allocator, kept here for comparison.
+    dirs = [d for d in os.listdir(folder) if os.path.isdir(os.path.join(folder, d))]
+    v_dirs = [d for d in dirs if re.match(r'v\d{4}', d)]
+    numbers = [int(re.sub(r'[a-z]', '', d)) for d in v_dirs]
+    try:
+        max_number = max(numbers)
+    except ValueError:
+        max_number = 0
+    return f"v{(str(max_number + 1)).zfill(4)}"
+
+
+def claim_many(folder, threads, claims):
+    # Runs in its own process, with its own allocator like a second server would.
+    allocator = VersionAllocator()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda _: allocator.claim(folder)[0], range(threads * claims)))
+
+
+def stress(folder, processes, threads, claims):
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(claim_many, [(folder, threads, claims)] * processes)
+    seconds = time.perf_counter() - start
+    versions = [version for result in results for version in result]
+    expected = [format_version(number) for number in range(1, len(versions) + 1)]
+    assert len(set(versions)) == len(versions), "The same version was handed out twice."
+    assert sorted(versions) == expected, "The claimed versions have gaps."
+    assert sorted(os.listdir(folder)) == expected
+    print(f"{len(versions)} claims from {processes} processes x {threads} threads in {seconds * 1000:.1f} ms, "
+          f"all unique and contiguous")
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def compare(folder, existing, repeat=20):
+    os.makedirs(folder)
+    for number in range(1, existing + 1):
+        os.mkdir(os.path.join(folder, format_version(number)))
+    allocator = VersionAllocator()
+    allocator.claim(folder)  # Prime the cache, as a running server would have.
+    legacy = best_time(lambda: legacy_next_version(folder), repeat)
+    claim = best_time(lambda: allocator.claim(folder), repeat)
+    print(f"{existing} existing versions  legacy lookup {legacy * 1000:8.3f} ms  "
+          f"cached claim (incl. mkdir) {claim * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--claims", type=int, default=25, help="Claims per thread.")
+    parser.add_argument("--existing", type=int, default=2000, help="Versions already in the folder for the timing.")
+    args = parser.parse_args()
+
+    for run in (lambda folder: stress(folder, args.processes, args.threads, args.claims),
+                lambda folder: compare(folder, args.existing)):
+        directory = tempfile.mkdtemp(prefix="version_stress_")
+        try:
+            run(os.path.join(directory, "PROJ_ABC", "SEQ010", "SH0010", "comp", "render", "main"))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
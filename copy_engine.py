@@ -0,0 +1,171 @@
+import os
+import time
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024  # Bytes per copy_file_range call.
+COPY_QUEUE_PER_WORKER = 4  # Copies queued ahead per worker while the operations are still being generated.
+# copy_file_range is switched off for the whole process the first time the kernel says it is not supported.
+_copy_file_range_supported = hasattr(os, "copy_file_range")
+# Errors that mean "this pair of files can't use copy_file_range", not that the copy failed.
+_COPY_FILE_RANGE_FALLBACK_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EPERM,
+                                    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+
+def copy_file(source_path, destination_path):
+    """
+    Copies a file with its metadata like shutil.copy2, using the kernel's zero-copy paths.
+
+    os.copy_file_range is tried first: it stays in the kernel, reflinks on btrfs/XFS and does
+    server side copies on NFS 4.2 and SMB3. Otherwise shutil.copyfile is used, which itself
+    uses sendfile on Linux, fcopyfile on macOS and CopyFile2 on Windows.
+
+    Returns:
+        int: The number of bytes copied.
+    """
+    global _copy_file_range_supported
+    size = os.stat(source_path).st_size
+    copied = False
+    if _copy_file_range_supported and size:
+        try:
+            with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+                remaining = size
+                while remaining > 0:
+                    written = os.copy_file_range(source.fileno(), destination.fileno(), min(remaining, COPY_CHUNK_SIZE))
+                    if written == 0:
+                        break
+                    remaining -= written
+            copied = remaining == 0
+        except OSError as e:
+            if e.errno not in _COPY_FILE_RANGE_FALLBACK_ERRORS:
+                raise
+            if e.errno == errno.ENOSYS:
+                _copy_file_range_supported = False
+    if not copied:
+        shutil.copyfile(source_path, destination_path)
+    shutil.copystat(source_path, destination_path)
+    return size
+
+
+class LazyOperations:
+    """
+    Re-iterable (source, destination) pairs generated by make() each time they are iterated, with a known length.
+
+    Lets a plan describe a huge copy without holding every path pair in memory.
+    """
+
+    def __init__(self, make, length):
+        self.make = make
+        self.length = length
+
+    def __iter__(self):
+        return iter(self.make())
+
+    def __len__(self):
+        return self.length
+
+
+class CopyStats:
+    def __init__(self, total_files=0):
+        self.total_files = total_files
+        self.files = 0
+        self.bytes = 0
+        self.errors = []
+        self.failures = {}  # (source path, destination path) -> error
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    def add_error(self, source_path, destination_path, error):
+        with self._lock:
+            self.errors.append(f"{source_path}: {error}")
+            self.failures[(source_path, destination_path)] = str(error)
+
+    def add_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def cancelled(self):
+        return self.skipped > 0
+
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def eta(self):
+        # Seconds left at the current rate, None until the first file is done.
+        if not self.files:
+            return None
+        return round(self.seconds() / self.files * (self.total_files - self.files), 1)
+
+    def as_dict(self):
+        seconds = self.seconds()
+        return {
+            "files": self.files,
+            "total_files": self.total_files,
+            "bytes": self.bytes,
+            "seconds": round(seconds, 3),
+            "files_per_second": round(self.files / seconds, 2) if seconds else 0.0,
+            "mb_per_second": round(self.bytes / seconds / 1024 ** 2, 2) if seconds else 0.0,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+def copy_files(copy_operations, workers=8, progress=None, cancel=None, total_files=None):
+    """
+    Copies many files on a bounded thread pool. Destination folders must already exist.
+
+    The operations are consumed as the copies go, so a generator is never materialised and the first
+    copies start straight away.
+
+    Args:
+        copy_operations (iterable): (source path, destination path) pairs, e.g. a list or LazyOperations.
+        workers (int): Number of copies in flight at once.
+        progress (callable, optional): Called with the CopyStats after every file.
+        cancel (threading.Event, optional): Once set, the files not started yet are skipped.
+        total_files (int, optional): Number of operations, for the ETA. Defaults to len(copy_operations).
+
+    Returns:
+        CopyStats: Files, bytes, throughput and per-file errors. A failed file does not stop the others.
+    """
+    if total_files is None:
+        total_files = len(copy_operations) if hasattr(copy_operations, "__len__") else 0
+    stats = CopyStats(total_files=total_files)
+
+    def copy_one(operation):
+        source_path, destination_path = operation
+        if cancel is not None and cancel.is_set():
+            stats.add_skipped()
+            return
+        try:
+            stats.add(copy_file(source_path, destination_path))
+        except OSError as e:
+            stats.add_error(source_path, destination_path, e)
+        if progress is not None:
+            progress(stats)
+
+    if workers <= 1 or total_files == 1:
+        for operation in copy_operations:
+            copy_one(operation)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="copy") as executor:
+            # Only a few copies are queued per worker, and .result() surfaces exceptions raised in copy_one.
+            pending = set()
+            for operation in copy_operations:
+                if len(pending) >= workers * COPY_QUEUE_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(copy_one, operation))
+            for future in pending:
+                future.result()
+    stats.finished = time.perf_counter()
+    return stats
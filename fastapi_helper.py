@@ -1,12 +1,312 @@
 import os
 import json
-import shutil
-import re
-from collections import defaultdict
-from fastapi import FastAPI, HTTPException, Request, Body, Path
+import time
+import asyncio
+import hashlib
+import functools
+import itertools
+import threading
+import contextvars
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import FastAPI, HTTPException, Request, Response, Body, Path
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+from sequence_scanner import FRAME_MODES, scan_sequences, compact_listing, list_frames
+from scan_index import ScanIndex, ScanIndexWatcher
+from copy_engine import copy_files, LazyOperations
+from job_queue import JobQueue
+from version_allocator import version_allocator
+from template_cache import TemplateCache
+from path_mapping import PathMapper, load_roots
+from api_models import (FastJSONResponse, model_data, WorkspaceRequest, WorkspaceResponse, FilesRequest,
+                        FilesResponse, IngestRequest, IngestResponse, IngestBatchRequest, IngestBatchResponse)
+from ingest_manifest import (DEDUP_MODES, VERIFY_MODES, describe_sources, latest_manifest, same_sources,
+                             unchanged_files, write_manifest, link_files, verify_copies)
+from telemetry import (CORRELATION_HEADER, CONTENT_TYPE, registry, correlation_id, current_spans, new_correlation_id,
+                       span, server_timing, request_seconds, files_written, bytes_written, copy_errors, record_cache,
+                       event_loop_lag)
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+PROMPT_FILES = {
+    "relevance_prompt": "relevance_prompt.txt",
+    "user_intent_prompt": "user_intent.txt",
+    "setup_prompt": "setup_prompt.txt",
+    "ingestion_prompt": "ingestion_prompt.txt",
+    "extract_ingestion_prompt": "extract_ingestion_prompt.txt",
+    "route_prompt": "route_prompt.txt",  # Relevance and intent in a single call.
+}
+PROMPT_WATCH_INTERVAL = float(os.getenv("PROMPT_WATCH_INTERVAL", "2.0"))  # Seconds between prompt file checks.
+# SQLite index of scanned ingest folders, "" scans every request from scratch.
+SCAN_INDEX_PATH = os.getenv("SCAN_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_index.db"))
+SCAN_INDEX_WATCH = os.getenv("SCAN_INDEX_WATCH", "false").lower() == "true"  # Refresh indexed folders with inotify.
+COPY_WORKERS = int(os.getenv("COPY_WORKERS", "8"))  # Frames copied at once per ingest.
+# Threads for the blocking filesystem work of the endpoints (ingests, scans, workspaces, job queue), so the
+# event loop only ever waits on them.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+SCAN_PROCESSES = int(os.getenv("SCAN_PROCESSES", "2"))  # Processes parsing big folder listings, 0 scans in a thread.
+# File sizes in /get_files_folders: "auto" only where scandir has them for free (Windows), "true" stats every
+# file (slow on network shares), "false" never.
+SCAN_SIZES = os.getenv("SCAN_SIZES", "auto").lower()
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # Seconds between event loop lag samples.
+# Print one line per request that did real work, with its correlation id and the time of each stage.
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "true").lower() == "true"
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Background jobs run at once.
+# Storage roots ("temp" for ingest and templates, "project" for workspaces) per platform, as JSON or a JSON file.
+# e.g. {"temp": {"linux": "/srv/temp"}, "project": {"linux": "/srv/projects"}}, unset keeps T:\ and P:\ on Windows.
+STORAGE_ROOTS = os.getenv("STORAGE_ROOTS", "")
+path_mapper = PathMapper(load_roots(STORAGE_ROOTS))
+# Holds one template folder per department.
+TEMPLATES_ROOT = os.getenv("TEMPLATES_ROOT") or path_mapper.join("temp", "Templates")
+# "clone" pre-indexes the templates and reflinks/hardlinks/copies their files, "copy" is a plain copytree.
+TEMPLATE_CLONE_MODE = os.getenv("TEMPLATE_CLONE_MODE", "clone")
+# Comma separated file name patterns (e.g. "*.exr,*.hdr,*.tx") that are never edited in place and can be hardlinked.
+TEMPLATE_IMMUTABLE = os.getenv("TEMPLATE_IMMUTABLE", "")
+TEMPLATE_CHECK_INTERVAL = float(os.getenv("TEMPLATE_CHECK_INTERVAL", "30"))  # Seconds before a template is re-checked.
+# Default dedup mode of versioned ingests, one of DEDUP_MODES. An ingest payload can set its own with "dedup".
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "off")
+# Checks of copied files, one of VERIFY_MODES. An ingest payload can set its own with "verify".
+INGEST_VERIFY = os.getenv("INGEST_VERIFY", "fast")
+# Frame numbering of sequence ingests, one of FRAME_MODES. An ingest payload can set its own with "frames".
+INGEST_FRAME_MODE = os.getenv("INGEST_FRAME_MODE", "offset")
+INGEST_FRAME_START = int(os.getenv("INGEST_FRAME_START", "1001"))
+
+
+class PromptEntry:
+    def __init__(self, content, etag, signature):
+        self.content = content
+        self.etag = etag
+        self.signature = signature  # (st_ino, st_mtime_ns, st_size) of the file when it was read.
+
+
+class PromptRegistry:
+    """
+    Holds every prompt in memory so the prompt endpoints never touch the disk.
+
+    Prompts are loaded once with load_all() and refresh() only re-reads a prompt
+    when the inode, mtime or size of its file has changed.
+    """
+
+    def __init__(self, prompt_dir, prompt_files):
+        self.prompt_dir = prompt_dir
+        self.prompt_files = prompt_files  # prompt name -> file name inside prompt_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.prompt_dir, self.prompt_files[name])
+
+    def load_all(self):
+        for name in self.prompt_files:
+            self._reload(name, force=True)
+
+    def refresh(self):
+        # Returns the names of the prompts that were reloaded.
+        return [name for name in self.prompt_files if self._reload(name)]
+
+    def get(self, name):
+        # Served straight from memory, None if the prompt could not be read.
+        return self._entries.get(name)
+
+    def _reload(self, name, force=False):
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                return self._entries.pop(name, None) is not None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(name)
+        if not force and entry is not None and entry.signature == signature:
+            return False
+
+        content = read_file(path)
+        if content is None:
+            return False
+        etag = '"%s"' % hashlib.sha1(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._entries[name] = PromptEntry(content, etag, signature)
+        return entry is None or entry.etag != etag
+
+
+prompt_registry = PromptRegistry(PROMPTS_DIR, PROMPT_FILES)
+template_cache = TemplateCache(TEMPLATE_CHECK_INTERVAL, TEMPLATE_IMMUTABLE.split(","), workers=COPY_WORKERS)
+scan_index = None
+scan_index_watcher = None
+job_queue = None
+io_executor = None
+scan_executor = None
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes a sleeping task, which is how long something blocked the loop.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.samples += 1
+
+    def stats(self):
+        return {
+            "last_ms": round(self.last * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "mean_ms": round(self.total / self.samples * 1000, 2) if self.samples else 0.0,
+            "samples": self.samples,
+            "interval": self.interval,
+        }
+
+
+loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL)
+
+
+async def run_blocking(function, *args, **kwargs):
+    # Run blocking filesystem work on the I/O pool and wait for it without blocking the event loop.
+    # The request's context goes with it, so spans timed in the worker end up in the request's trace.
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor, context.run, functools.partial(function, *args, **kwargs))
+
+
+def run_scan(directory, extension_filter=None, with_sizes=None):
+    # scan_sequences in a scan process when there are any, parsing a huge listing is CPU bound.
+    global scan_executor
+    if with_sizes is None and SCAN_SIZES != "auto":
+        with_sizes = SCAN_SIZES == "true"
+    if scan_executor is not None:
+        try:
+            return scan_executor.submit(scan_sequences, directory, extension_filter, with_sizes).result()
+        except BrokenProcessPool as e:
+            print(f"Scan processes stopped working, scanning in threads from now on: {e}")
+            scan_executor = None
+    return scan_sequences(directory, extension_filter, with_sizes)
+
+
+async def watch_prompts(registry, interval):
+    # Poll the prompt files and reload only the ones that changed on disk.
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reloaded = await run_blocking(registry.refresh)
+        except Exception as e:
+            print(f"Prompt refresh failed: {e}")
+            continue
+        if reloaded:
+            print(f"Reloaded prompts: {reloaded}")
+
+
+async def preload_templates():
+    try:
+        roots = await run_blocking(template_cache.preload, TEMPLATES_ROOT)
+        print(f"Indexed templates: {roots}")
+    except OSError as e:
+        print(f"Template indexing failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global scan_index, scan_index_watcher, job_queue, io_executor, scan_executor
+    io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    if SCAN_PROCESSES > 0:
+        try:
+            # Not forked: the server's threads may hold locks (logging, sqlite, the io pool) a forked child would
+            # inherit locked. forkserver starts the workers from a clean process, spawn where it's not available.
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            scan_executor = ProcessPoolExecutor(max_workers=SCAN_PROCESSES,
+                                                mp_context=multiprocessing.get_context(start_method))
+        except (OSError, NotImplementedError, ImportError) as e:  # No working multiprocessing on this host.
+            print(f"Scan processes disabled: {e}")
+    lag_monitor = asyncio.create_task(loop_lag.run())
+    prompt_registry.load_all()
+    prompt_watcher = None
+    if PROMPT_WATCH_INTERVAL > 0:
+        prompt_watcher = asyncio.create_task(watch_prompts(prompt_registry, PROMPT_WATCH_INTERVAL))
+    if SCAN_INDEX_PATH:
+        scan_index = ScanIndex(SCAN_INDEX_PATH, scanner=run_scan)
+        if SCAN_INDEX_WATCH:
+            try:
+                scan_index_watcher = ScanIndexWatcher(scan_index)
+                scan_index_watcher.start()
+            except (RuntimeError, OSError) as e:
+                print(f"Scan index watcher disabled: {e}")
+                scan_index_watcher = None
+    job_queue = JobQueue(JOB_DB_PATH, {"ingest": run_ingest, "ingest_batch": run_ingest_batch,
+                                       "create_workspace": run_create_workspace},
+                         workers=JOB_WORKERS)
+    job_queue.start()
+    template_preloader = None
+    if TEMPLATE_CLONE_MODE == "clone":
+        # Index the department templates in the background, workspaces made before it finishes index on demand.
+        template_preloader = asyncio.create_task(preload_templates())
+    yield
+    job_queue.stop()
+    if template_preloader:
+        template_preloader.cancel()
+    if prompt_watcher:
+        prompt_watcher.cancel()
+    if scan_index_watcher:
+        scan_index_watcher.stop()
+    if scan_index:
+        scan_index.close()
+    lag_monitor.cancel()
+    if scan_executor:
+        scan_executor.shutdown(cancel_futures=True)
+    io_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def endpoint_label(request, status):
+    # The route template (e.g. /jobs/{job_id}) rather than the raw path, so every job id isn't its own series.
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    return "unmatched" if status == 404 else request.url.path
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Tags the request with the caller's correlation id (or a new one), times it and reports the time of its stages.
+    request_id = request.headers.get(CORRELATION_HEADER) or new_correlation_id()
+    correlation_id.set(request_id)
+    spans = []
+    current_spans.set(spans)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        seconds = time.perf_counter() - started
+        request_seconds.observe(seconds, method=request.method, endpoint=endpoint_label(request, status),
+                                status=status)
+        if TRACE_REQUESTS and spans:
+            stages = " ".join(f"{stage}={stage_seconds * 1000:.1f}ms" for stage, stage_seconds in spans)
+            print(f"[{request_id}] {request.method} {request.url.path} {status} {seconds * 1000:.1f}ms {stages}")
+    response.headers[CORRELATION_HEADER] = request_id
+    if spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
 
 # Define the GET endpoints
 @app.get("/ping")
@@ -14,55 +314,79 @@ async def ping():
     return {"message": "Pong!"}
 
 
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint: request and stage latencies, files and bytes written, cache hits and loop lag.
+    event_loop_lag.set(loop_lag.last, stat="last")
+    event_loop_lag.set(loop_lag.max, stat="max")
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/loop_lag")
+async def get_loop_lag():
+    # How long the event loop has been blocked, should stay around a millisecond under any ingest load.
+    return {**loop_lag.stats(), "io_workers": IO_WORKERS, "scan_processes": SCAN_PROCESSES if scan_executor else 0}
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match can hold "*", a single tag or a comma separated list of (weak) tags.
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def serve_prompt(name, request):
+    entry = prompt_registry.get(name)
+    if entry is None:
+        return {"error": f"Could not read Prompt File: {prompt_registry.path(name)}."}
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        record_cache("prompt", hits=1)
+        return Response(status_code=304, headers=headers)
+    record_cache("prompt", misses=1)
+    return JSONResponse({"message": entry.content}, headers=headers)
+
+
+async def read_payload(request):
+    # The Pipeline sends its payloads JSON encoded once or twice, decode until there is a dict.
+    data = await request.json()
+    while isinstance(data, str):
+        data = json.loads(data)
+    return data
+
+
 @app.get("/relevance_prompt")
-async def relevance_prompt():
-    relevance_prompt_file = "prompts/relevance_prompt.txt"
-    # content = await read_file(relevance_prompt_file)  # async implementation
-    content = read_file(relevance_prompt_file)
-    if content:
-        return {"message": f"{content}"}
-    else:
-        return {"error": f"Could not read Prompt File: {relevance_prompt_file}."}
+async def relevance_prompt(request: Request):
+    return serve_prompt("relevance_prompt", request)
 
 
 @app.get("/user_intent_prompt")
-async def user_intent_prompt():
-    user_intent_prompt_file = "prompts/user_intent.txt"
-    content = read_file(user_intent_prompt_file)
-    if content:
-        return {"message": f"{content}"}
-    else:
-        return {"error": f"Could not read Prompt File: {user_intent_prompt_file}."}
+async def user_intent_prompt(request: Request):
+    return serve_prompt("user_intent_prompt", request)
 
 
 @app.get("/setup_prompt")
-async def setup_prompt():
-    setup_prompt_file = "prompts/setup_prompt.txt"
-    content = read_file(setup_prompt_file)
-    if content:
-        return {"message": f"{content}"}
-    else:
-        return {"error": f"Could not read Prompt File: {setup_prompt_file}."}
+async def setup_prompt(request: Request):
+    return serve_prompt("setup_prompt", request)
 
 
 @app.get("/ingestion_prompt")
-async def setup_prompt():
-    setup_prompt_file = "prompts/ingestion_prompt.txt"
-    content = read_file(setup_prompt_file)
-    if content:
-        return {"message": f"{content}"}
-    else:
-        return {"error": f"Could not read Prompt File: {setup_prompt_file}."}
+async def ingestion_prompt(request: Request):
+    return serve_prompt("ingestion_prompt", request)
 
 
 @app.get("/extract_ingestion_prompt")
-async def extract_ingestion_prompt():
-    setup_prompt_file = "prompts/extract_ingestion_prompt.txt"
-    content = read_file(setup_prompt_file)
-    if content:
-        return {"message": f"{content}"}
-    else:
-        return {"error": f"Could not read Prompt File: {setup_prompt_file}."}
+async def extract_ingestion_prompt(request: Request):
+    return serve_prompt("extract_ingestion_prompt", request)
+
+
+@app.get("/route_prompt")
+async def route_prompt(request: Request):
+    return serve_prompt("route_prompt", request)
 
 
 def read_file(file_path):
@@ -73,15 +397,6 @@ def read_file(file_path):
         return None
 
 
-# async def read_file(file_path):
-#     import aiofiles
-#     try:
-#         async with aiofiles.open(file_path, 'r') as f:
-#             content = await f.read()
-#             return content.decode('utf-8')
-#     except FileNotFoundError:
-#         return None
-
 @app.post("/create_workspace")
 async def create_workspace(request: Request):
     data = await request.json()
@@ -97,69 +412,66 @@ async def create_workspace(request: Request):
         "user": "Alice"
     }
     """
+    # The template copy blocks, so run it in a worker thread to keep the event loop free.
+    result = await run_blocking(run_create_workspace, data)
+    # Convert to json String
+    result = json.dumps(result)
+    return result
+
+
+def run_create_workspace(data, job=None):
     # Init
     completed_status = False
     project_folder_path = None
     template_root_path = None
     errors = None
+    template_stats = None
     # Craft Path
-    root_temp_drive = "T:\\"
-    root_project_drive = "P:\\"
-
     try:
-        project_folder_path = os.path.join(root_project_drive, *data.values())
+        project_folder_path = path_mapper.join("project", *data.values())
     except TypeError:
-        return json.dumps({"result": False})
-    # CHeck if this folder exists:
-    if not os.path.exists(project_folder_path):
-        project_folder_path = os.path.join(project_folder_path, "v0001")  # Create a v0001 folder as it didnt exist.
-    else:
-        # Get all folders that match the regex v0001
-        # List all directories in the folder
-        dirs = [d for d in os.listdir(project_folder_path) if os.path.isdir(os.path.join(project_folder_path, d))]
-        # Filter directories with the pattern vXXXX
-        v_dirs = [d for d in dirs if re.match(r'v\d{4}', d)]
-        # Extract the number from each directory name and convert it to an integer
-        numbers = [int(re.sub(r'[a-z]', '', d)) for d in v_dirs]
-        # Get the largest number
-        try:
-            max_number = max(numbers)
-        except ValueError:
-            max_number = 0
-        project_folder_path = os.path.join(project_folder_path, f"v{(str(max_number+1)).zfill(4)}")
-
-    # Create folder(s)
+        return {"result": False}
+    # Claim the next vXXXX folder (v0001 if the folder didn't exist), this creates it.
     try:
-        os.makedirs(project_folder_path, exist_ok=True)
+        with span("version"):
+            _, project_folder_path = version_allocator.claim(project_folder_path)
     except Exception as e:
-        errors += f"Error creating {str(project_folder_path)}: {e}\n"
+        errors = (errors or "") + f"Error creating {str(project_folder_path)}: {e}\n"
 
     # Copy the template folder from the template section:
-    template_root_path = os.path.join(root_temp_drive, "Templates", data["department"])  # T:\Templates\{department}
+    template_root_path = os.path.join(TEMPLATES_ROOT, data["department"])  # {temp}/Templates/{department}
     project_folder_path = os.path.join(project_folder_path, data["department"])  # project_folder_path\{department}
     # Check if the Department path exists for this
     if os.path.exists(template_root_path):
         # Copy over the folder.
         try:
-            print(template_root_path, project_folder_path)
-            shutil.copytree(template_root_path, project_folder_path)
+            with span("template_clone"):
+                template_stats = template_cache.clone(template_root_path, project_folder_path, TEMPLATE_CLONE_MODE)
+            record_template(template_stats)
+            print(template_root_path, project_folder_path, template_stats)
             completed_status = True
         except Exception as e:
             print(e)
-            errors += f"Error creating {str(project_folder_path)}: {str(e)}\n"
+            errors = (errors or "") + f"Error creating {str(project_folder_path)}: {str(e)}\n"
 
     # Handle Return Data:
     result = {
         "result": completed_status,
         "destination": project_folder_path,
         "template_used": template_root_path,
+        "template_stats": template_stats,  # Clone mode, files per strategy and timings.
         "error": errors
     }
-    # Convert to json String
-    result = json.dumps(result)
     return result
 
 
+def record_template(template_stats):
+    # Files and bytes of a template clone per strategy, a plain copytree doesn't count them.
+    for method, files in template_stats.get("files", {}).items():
+        files_written.inc(files, kind="template", method=method)
+        bytes_written.inc(template_stats["bytes"][method], kind="template", method=method)
+
+
 def get_files_in_directory(directory, extension_filter=None):
     """
     Detects file sequences dynamically in a directory and returns compact representations as tuples.
@@ -173,42 +485,19 @@ def get_files_in_directory(directory, extension_filter=None):
         list: A list of tuples for file sequences or individual filenames.
               Each tuple contains the first and last file in a sequence.
     """
-    # List all files in the directory
-    files = os.listdir(directory)
-
-    # Filter files by extension if specified
-    if extension_filter:
-        files = [file for file in files if file.endswith(extension_filter)]
-
-    # Dictionary to group sequences by base name
-    sequences = defaultdict(list)
-    other_files = []
-
-    # Regular expression to detect numbers in filenames
-    dynamic_pattern = re.compile(r"^(.*?)(\d+)(\.\w+)$")
-
-    for file in files:
-        match = dynamic_pattern.match(file)
-        if match:
-            base_name = match.group(1)  # Base name without numbers
-            frame_index = int(match.group(2))  # Extract numerical part
-            extension = match.group(3)  # File extension
-            sequences[(base_name, extension)].append((frame_index, file))
-        else:
-            other_files.append(file)
-
-    # Create compact sequence representations
-    compact_files = []
-    for (base_name, extension), frames in sequences.items():
-        frames.sort()  # Sort by frame index
-        if len(frames) > 1:  # If a sequence exists
-            compact_files.append((frames[0][1], frames[-1][1]))  # Add first and last files as a tuple
-        else:  # Single frame, treat as a regular file
-            compact_files.append(frames[0][1])
-
-    # Add non-sequence files to the result
-    compact_files.extend(other_files)
-    return compact_files
+    return compact_listing(scan_sequences(directory, extension_filter, with_sizes=False))
+
+
+def scan_folder(directory, refresh=False):
+    # Returns (scan, cached), going through the scan index when there is one.
+    with span("scan"):
+        if scan_index is None:
+            return run_scan(directory), False
+        result = scan_index.scan(directory, refresh=refresh)
+    record_cache("scan_index", hits=int(result[1]), misses=int(not result[1]))
+    if scan_index_watcher is not None:
+        scan_index_watcher.watch(directory)
+    return result
 
 
 @app.post("/get_files_folders")
@@ -223,23 +512,28 @@ async def get_files_folders(request: Request):
 
     """ Example
     {"search_path": path_to_search,
-    "folders_to_search": folders_to_search}
+    "folders_to_search": folders_to_search,
+    "refresh": false}  # Optional, true ignores the scan index.
     """
     # Start
     return_dict = {}
     files_data = None
     file_path = ""
+    cached = False
     try:
-        search_path = data["search_path"].replace("\\", "/")
+        search_path = path_mapper.to_local(data["search_path"])  # Sent as a Windows path or any other platform's.
         folder_seach = data["folders_to_search"]
         file_path = os.path.join(search_path, folder_seach)
-        files_data = get_files_in_directory(file_path)
+        scan, cached = await run_blocking(scan_folder, file_path, data.get("refresh", False))
+        files_data = compact_listing(scan)
     except:
         return_dict = {"error": f"An Error Occurred with searching the path: {file_path}."}
 
     if files_data:
         data_dict = {"search_path": file_path,
-                     "files_found": files_data}
+                     "files_found": files_data,
+                     "sequences": scan["sequences"],  # Frame ranges, holes, padding and sizes per sequence.
+                     "cached": cached}  # True when the listing came from the scan index.
         return_dict = {"message": data_dict}
 
     return json.dumps(return_dict)
@@ -283,122 +577,433 @@ async def ingest_request(request: Request):
             "user": "Alice"
         }
         """
+    # The copies block, so the whole ingest runs in a worker thread to keep the event loop free.
+    result = await run_blocking(run_ingest, data)
+    # Convert to json String
+    result = json.dumps(result)
+    return result
+
+
+def plan_ingest(data, source_hashes=None):
+    """
+    Works out the version, destination names and copy operations of one ingest payload.
+
+    The version folder is claimed (created) only when there is something to copy. With dedup the
+    source is compared with the latest version's manifest first: an identical source claims no new
+    version, and in "link" mode the unchanged files are hardlinked from the latest version.
+
+    Sequence frames are sorted by frame number and named as they are copied, so the copy
+    operations of a huge sequence are generated on demand rather than held in memory.
+
+    Args:
+        data (dict): An /ingest_request payload, optionally with "dedup" set to one of DEDUP_MODES,
+                     "verify" to one of VERIFY_MODES and "frames" to one of FRAME_MODES.
+        source_hashes (dict, optional): source path -> (size, mtime_ns, hash) shared by the ingests of a batch,
+                                        so a source is only hashed once.
 
+    Returns:
+        dict: source_path, ingestion_path, destination_path, the (source, destination) copy_operations and
+              link_operations, files as (source name, source path, destination path), the verify mode,
+              whether to write a manifest, the dedup source entries and stats, and the ignored files.
+              copy_operations is empty when the source doesn't exist or has no matching files.
+    """
     # Init
-    completed_status = False
-    errors = None
     destination_path = None
+    version = None
+    link_operations = []
 
     # Start
+    dedup = data.get("dedup") or INGEST_DEDUP
+    if dedup not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode: {dedup}")
+    verify = data.get("verify") or INGEST_VERIFY
+    if verify not in VERIFY_MODES:
+        raise ValueError(f"Unknown verify mode: {verify}")
+    frame_mode = data.get("frames") or INGEST_FRAME_MODE
+    if frame_mode not in FRAME_MODES:
+        raise ValueError(f"Unknown frame mode: {frame_mode}")
 
     # Handle the path to create.
     # Construct new path from logic
-    root_temp_drive = "T:\\"
-    root_project_drive = "P:\\"
-
-    ingestion_path = os.path.join(root_project_drive,
-                                  data["project"],
-                                  data["sequence"],
-                                  data["shot"],
-                                  data["department"],
-                                  data["type"],
-                                  data["naming_scheme"]
-                                  )
-
-    # Add versioning if specified.
-    if data["naming_scheme"]:
-        # Check if the path exists and if so get all versions.
-        # CHeck if this folder exists:
-        if not os.path.exists(ingestion_path):
-            ingestion_path = os.path.join(ingestion_path, "v0001")  # Create a v0001 folder as it didnt exist.
-            version = "v0001"
-        else:
-            # Get all folders that match the regex v0001
-            # List all directories in the folder
-            dirs = [d for d in os.listdir(ingestion_path) if os.path.isdir(os.path.join(ingestion_path, d))]
-            # Filter directories with the pattern vXXXX
-            v_dirs = [d for d in dirs if re.match(r'v\d{4}', d)]
-            # Extract the number from each directory name and convert it to an integer
-            numbers = [int(re.sub(r'[a-z]', '', d)) for d in v_dirs]
-            # Get the largest number
-            try:
-                max_number = max(numbers)
-            except ValueError:
-                max_number = 0
-            version = f"v{(str(max_number + 1)).zfill(4)}"
-            ingestion_path = os.path.join(ingestion_path, version)
+    ingestion_path = path_mapper.join("project",
+                                      data["project"],
+                                      data["sequence"],
+                                      data["shot"],
+                                      data["department"],
+                                      data["type"],
+                                      data["naming_scheme"]
+                                      )
 
     # Handle the File renaming and Copy.
     # If it's a file extract the file name from the src_path as it expects a full path to the file.
-    source_path = data["src_path"]
-    #Convert to Windows Path
-    source_path = source_path.replace("/", "\\")
-    drive_letter = source_path[0]
-    source_path = source_path.replace(f"{drive_letter}:/", f"{drive_letter}:\\\\")
+    source_path = path_mapper.to_local(data["src_path"])  # The LLM writes it with forward slashes.
+    plan = {"source_path": source_path, "ingestion_path": ingestion_path, "destination_path": None,
+            "copy_operations": [], "link_operations": [], "files": [], "verify": verify, "manifest": False,
+            "entries": None, "dedup": None, "ignored_files": []}
 
+    # Find what there is to copy before claiming a version for it.
+    listing = None
     if not data["is_sequence"]:
-
         # Is expected to be a file.
-        if os.path.exists(source_path):  # Check if file exists
-            if os.path.isfile(source_path):  # Check if the path is a file.
-                # Construct a new name for the file to copy.
-                if data["versioning"]:
-                    # {naming_scheme}_{version}.{ext}
-                    new_file_name = f'{data["naming_scheme"]}_{version}.{data["ext"]}'
-                else:
-                    # {naming_scheme}.{ext}
-                    new_file_name = f'{data["naming_scheme"]}.{data["ext"]}'
-                destination_full_path = os.path.join(ingestion_path, new_file_name)
-
-                # Copy File command
-                os.makedirs(ingestion_path, exist_ok=True)
-                shutil.copy2(source_path, destination_full_path)
-                completed_status = True
-                destination_path = destination_full_path
+        if not os.path.isfile(source_path):  # Check if the path is a file.
+            return plan
+        source_folder = os.path.dirname(source_path)
+        source_names = [os.path.basename(source_path)]
     else:
-
         # Folder Ingestion.
         # Is expected to be a folder.
-        if os.path.exists(source_path):  # Check if path exists
-            if os.path.isdir(source_path):  # Check if the path is a folder.
-                # Find everything with relevant ext
-                ext = data["extension"]
-                relevant_files = [filename for filename in os.listdir(source_path) if filename.endswith(f".{ext}")]  # Should return a list of all files in the folder matching the ext
-                if relevant_files:
-                    # Construct a new name for the file to copy.
-                    file_number = 0
-
-                    for i in range(len(relevant_files)):
-                        file_number += 1
-                        file_number_offset = 1000
-                        file_number_string = str(file_number + file_number_offset)
-                        if data["versioning"]:
-                            new_file_name = f'{data["naming_scheme"]}_{version}.{file_number_string}.{ext}'
-                        else:
-                            new_file_name = f'{data["naming_scheme"]}.{file_number_string}.{ext}'
-                        destination_full_path = os.path.join(ingestion_path, new_file_name)
-                        source_path_file = os.path.join(source_path, relevant_files[i])
-                        # Copy File command
-                        print(source_path_file, destination_full_path)
-                        os.makedirs(ingestion_path, exist_ok=True)
-                        shutil.copy2(source_path_file, destination_full_path)
-
-                    if file_number == len(relevant_files):
-                        completed_status = True
-                    destination_path = ingestion_path
+        if not os.path.isdir(source_path):  # Check if the path is a folder.
+            return plan
+        # Find everything with relevant ext, the frames are sorted by frame number.
+        ext = data["extension"]
+        listing = list_frames(source_path, f".{ext}")
+        if not len(listing):
+            return plan
+        plan["ignored_files"] = listing.ignored_files()
+        source_folder = source_path
+        source_names = (name for name, _ in listing.renumber(frame_mode, INGEST_FRAME_START))
+
+    # Compare with the latest version before claiming a new one.
+    entries = None
+    unchanged = {}
+    if data["naming_scheme"] and dedup != "off":
+        sources = {name: os.path.join(source_folder, name) for name in source_names}
+        previous_path, previous = latest_manifest(ingestion_path)
+        hash_started = time.perf_counter()
+        with span("hash"):
+            entries, hashed = describe_sources(sources, previous, workers=COPY_WORKERS, source_hashes=source_hashes)
+        record_cache("manifest_hash", hits=len(entries) - hashed, misses=hashed)
+        plan["dedup"] = {"mode": dedup, "skipped": False, "hashed": hashed, "linked": 0,
+                         "hash_seconds": round(time.perf_counter() - hash_started, 3)}
+        if previous is not None and previous.get("frames") == frame_mode and same_sources(previous, entries):
+            # Identical to the latest version and numbered the same way, point at it instead of making a copy.
+            plan["dedup"]["skipped"] = True
+            plan["ingestion_path"] = plan["destination_path"] = previous_path
+            if not data["is_sequence"]:
+                plan["destination_path"] = os.path.join(previous_path, next(iter(previous["files"])))
+            return plan
+        if previous is not None and dedup == "link":
+            unchanged = {name: os.path.join(previous_path, file_name)
+                         for name, file_name in unchanged_files(previous, entries).items()}
 
-    # Handle Return Data:
-    result = {
-        "result": completed_status,
+    # Add versioning if specified.
+    if data["naming_scheme"]:
+        # Claim the next vXXXX folder (v0001 if the folder didn't exist), this creates it.
+        with span("version"):
+            version, ingestion_path = version_allocator.claim(ingestion_path)
+
+    if not data["is_sequence"]:
+        # Construct a new name for the file to copy.
+        file_ext = data.get("ext") or data["extension"]  # The extraction prompt only fills in "extension".
+        if data["versioning"]:
+            # {naming_scheme}_{version}.{ext}
+            new_file_name = f'{data["naming_scheme"]}_{version}.{file_ext}'
+        else:
+            # {naming_scheme}.{ext}
+            new_file_name = f'{data["naming_scheme"]}.{file_ext}'
+        destination_path = os.path.join(ingestion_path, new_file_name)
+        files = [(source_names[0], source_path, destination_path)]
+    else:
+        # Construct a new name for every frame, in frame order.
+        if data["versioning"]:
+            # {naming_scheme}_{version}.{frame}.{ext}
+            name_prefix = f'{data["naming_scheme"]}_{version}'
+        else:
+            # {naming_scheme}.{frame}.{ext}
+            name_prefix = data["naming_scheme"]
+
+        def frame_files():
+            for name, frame in listing.renumber(frame_mode, INGEST_FRAME_START):
+                yield (name, os.path.join(source_path, name),
+                       os.path.join(ingestion_path, f"{name_prefix}.{frame}.{ext}"))
+        files = LazyOperations(frame_files, len(listing))
+        destination_path = ingestion_path
+
+    if unchanged:
+        copy_operations = [(source, destination) for name, source, destination in files if name not in unchanged]
+        link_operations = [(unchanged[name], destination) for name, _, destination in files if name in unchanged]
+    else:
+        copy_operations = LazyOperations(lambda: ((source, destination) for _, source, destination in files),
+                                         len(files))
+
+    plan.update({
+        "ingestion_path": ingestion_path,
         "destination_path": destination_path,
-        "source_path": source_path,
-        "error": errors
+        "destination_folder": ingestion_path,
+        "copy_operations": copy_operations,
+        "link_operations": link_operations,  # (file in the latest version, destination) for "link" dedup.
+        "files": files,
+        # Versions get a manifest when dedup or verification is on.
+        "manifest": bool(data["naming_scheme"]) and (entries is not None or verify != "off"),
+        "entries": entries,  # source name -> size, mtime and hash, from dedup.
+        "frames": frame_mode,
+    })
+    return plan
+
+
+def link_unchanged(plan):
+    # Hardlink the unchanged files of a dedup ingest, the ones that can't be linked are copied instead.
+    if plan.get("link_operations"):
+        with span("link"):
+            failed = link_files(plan["link_operations"])
+        plan["copy_operations"].extend(failed)
+        plan["dedup"]["linked"] = len(plan["link_operations"]) - len(failed)
+        files_written.inc(plan["dedup"]["linked"], kind="ingest", method="hardlink")
+
+
+def verify_plan(plan, copy_stats, source_hashes=None):
+    # Check the copies of a plan against their sources, returns the verification stats.
+    # source_hashes is shared by the plans of a batch, see plan_ingest(), and gets the sources hashed here.
+    if plan.get("verify", "off") == "off" or not plan["copy_operations"] or (copy_stats and copy_stats.cancelled()):
+        return None
+    failures = copy_stats.failures if copy_stats else {}
+    copy_operations = [(source, destination) for source, destination in plan["copy_operations"]
+                       if (source, destination) not in failures]  # Failed copies are already reported.
+    entries = plan.get("entries") or {}
+    known_hashes = {source: file_hash for source, (_, _, file_hash) in (source_hashes or {}).items()}
+    known_hashes.update({source: entries[name]["hash"] for name, source, _ in plan["files"]
+                         if name in entries})  # Source hashes dedup already computed.
+    try:
+        with span("verify"):
+            plan["checks"], verification = verify_copies(copy_operations, plan["verify"], known_hashes,
+                                                         workers=COPY_WORKERS)
+    except OSError as e:
+        return {"mode": plan["verify"], "mismatches": [f"Verification failed: {e}"]}
+    if source_hashes is not None:
+        for source, destination in copy_operations:
+            check = plan["checks"].get(destination)
+            if check and check["hash"]:  # Verified, so the source has the destination's hash.
+                source_hashes[source] = (check["size"], check["mtime_ns"], check["hash"])
+    return verification
+
+
+def save_manifest(plan, result):
+    # Record what went into an ingest's version, once all of its files are in place.
+    if not plan.get("manifest") or not result["result"]:
+        return
+    entries = plan.get("entries") or {}
+    checks = plan.get("checks") or {}
+    files = {}
+    for name, _, destination in plan["files"]:
+        entry = dict(entries.get(name) or {"size": None, "mtime_ns": None, "hash": None})
+        entry.update({field: value for field, value in checks.get(destination, {}).items() if value is not None})
+        files[os.path.basename(destination)] = {"source": name, **entry}
+    try:
+        with span("manifest"):
+            write_manifest(plan["ingestion_path"], plan["source_path"], files, result["verification"], plan["frames"])
+    except OSError as e:
+        print(f"Could not write the ingest manifest of {plan['ingestion_path']}: {e}")
+
+
+def ingest_result(plan, copy_stats, verification=None):
+    # Result of one planned ingest once its copies have run and been verified.
+    failures = copy_stats.failures if copy_stats else {}
+    errors = []
+    if failures:
+        errors = [f"{source}: {failures[(source, destination)]}" for source, destination in plan["copy_operations"]
+                  if (source, destination) in failures]
+    errors.extend((verification or {}).get("mismatches", []))
+    planned = bool(plan["copy_operations"] or plan.get("link_operations") or (plan.get("dedup") or {}).get("skipped"))
+    completed_status = planned and not errors and not (copy_stats and copy_stats.cancelled())
+    return {
+        "result": completed_status,
+        "destination_path": plan["destination_path"],
+        "source_path": plan["source_path"],
+        "error": "\n".join(errors) or None,
+        "dedup": plan.get("dedup"),  # Skipped, hashed and linked file counts when dedup is on.
+        "verification": verification,  # Checked and hashed file counts, seconds and mismatches.
+        "ignored_files": plan.get("ignored_files", []),  # Files without a frame number next to the sequence.
     }
-    # Convert to json String
-    result = json.dumps(result)
+
+
+def run_ingest(data, job=None):
+    # job is set when this runs from the job queue, it receives copy progress and can cancel the copy.
+    with span("plan"):
+        plan = plan_ingest(data)
+    link_unchanged(plan)
+    copy_stats = None
+    if plan["copy_operations"]:
+        # Create the destination once then copy the frames in parallel.
+        os.makedirs(plan["destination_folder"], exist_ok=True)
+        with span("copy"):
+            copy_stats = copy_files(plan["copy_operations"], workers=COPY_WORKERS, progress=copy_progress(job),
+                                    cancel=job.cancel_event if job else None)
+        record_copy(copy_stats)
+        print(f"Copied {plan['source_path']} -> {plan['destination_path']}: {copy_stats.as_dict()}")
+
+    # Handle Return Data:
+    result = ingest_result(plan, copy_stats, verify_plan(plan, copy_stats))
+    save_manifest(plan, result)
+    result["copy_stats"] = copy_stats.as_dict() if copy_stats else None  # files, bytes, files/s and MB/s.
     return result
 
 
+def run_ingest_batch(data, job=None):
+    """
+    Plans every item of a batch in one pass and runs all their copies on one shared copy pool.
+
+    Items that only differ by "user" are the same ingest and run once, each of them gets the result.
+    Items sharing source files hash each source once, for dedup and verification, and are still copied to
+    each of their destinations.
+    Items into the same versioned folder get successive versions from the version allocator.
+
+    Returns:
+        dict: "results" in the same order as "items", and "copy_stats" for the whole batch.
+    """
+    items = data["items"] if isinstance(data, dict) else data
+    plans = {}  # dedupe key -> plan
+    item_keys = []
+    source_hashes = {}  # source path -> (size, mtime_ns, hash), shared by every plan of the batch
+    for index, item in enumerate(items):
+        key = f"item{index}"  # Until the item is known to be valid, so a bad item is never merged with another.
+        try:
+            if not isinstance(item, dict):
+                raise TypeError(f"expected an object, got {type(item).__name__}")
+            key = json.dumps({field: value for field, value in item.items() if field != "user"}, sort_keys=True)
+            if key not in plans:
+                with span("plan"):
+                    plans[key] = plan_ingest(item, source_hashes)
+        except (KeyError, TypeError, IndexError, ValueError, OverflowError, OSError) as e:
+            source_path = item.get("src_path") if isinstance(item, dict) else None
+            plans[key] = {"error": f"Invalid ingest item: {e!r}", "source_path": source_path}
+        item_keys.append(key)
+
+    copying = []
+    for plan in plans.values():
+        if "error" in plan:
+            continue
+        link_unchanged(plan)
+        if plan["copy_operations"]:
+            os.makedirs(plan["destination_folder"], exist_ok=True)
+            copying.append(plan["copy_operations"])
+    copy_stats = None
+    if copying:
+        # The plans' operations are chained rather than joined into one list, so they are generated as they copy.
+        with span("copy"):
+            copy_stats = copy_files(itertools.chain.from_iterable(copying), workers=COPY_WORKERS,
+                                    progress=copy_progress(job), cancel=job.cancel_event if job else None,
+                                    total_files=sum(len(operations) for operations in copying))
+        record_copy(copy_stats)
+
+    results = {}
+    for key, plan in plans.items():
+        if "error" in plan:
+            results[key] = {"result": False, "destination_path": None, "source_path": plan["source_path"],
+                            "error": plan["error"]}
+        else:
+            results[key] = ingest_result(plan, copy_stats, verify_plan(plan, copy_stats, source_hashes))
+            save_manifest(plan, results[key])
+    return {
+        "results": [results[key] for key in item_keys],
+        "copy_stats": copy_stats.as_dict() if copy_stats else None,
+    }
+
+
+def record_copy(copy_stats):
+    files_written.inc(copy_stats.files, kind="ingest", method="copy")
+    bytes_written.inc(copy_stats.bytes, kind="ingest", method="copy")
+    copy_errors.inc(len(copy_stats.failures), kind="ingest")
+
+
+def copy_progress(job):
+    # Progress callback for copy_files that publishes frames, bytes and ETA on a job.
+    if job is None:
+        return None
+
+    def report(stats):
+        job.report(frames_done=stats.files, frames_total=stats.total_files, bytes_done=stats.bytes,
+                   eta_seconds=stats.eta())
+    return report
+
+
+@app.post("/jobs/ingest")
+async def submit_ingest_job(request: Request):
+    # Same payload as /ingest_request, returns a job id straight away and the ingest runs in the background.
+    data = await read_payload(request)
+    return {"job_id": await run_blocking(job_queue.submit, "ingest", data)}
+
+
+@app.post("/ingest_batch")
+async def ingest_batch(request: Request):
+    data = await read_payload(request)
+
+    """ Example
+    {"items": [{ingest_request payload}, {ingest_request payload}, ...]}
+    """
+    return await run_blocking(run_ingest_batch, data)
+
+
+# v2 endpoints: typed request bodies, native JSON in and out (no double encoding) and an orjson response.
+# They return plain dicts so FastAPI validates them against the response_model before sending.
+@app.post("/v2/create_workspace", response_model=WorkspaceResponse, response_class=FastJSONResponse)
+async def create_workspace_v2(payload: WorkspaceRequest):
+    return await run_blocking(run_create_workspace, model_data(payload))
+
+
+@app.post("/v2/get_files_folders", response_model=FilesResponse, response_class=FastJSONResponse)
+async def get_files_folders_v2(payload: FilesRequest):
+    # Unlike /get_files_folders an empty folder is an empty files_found, and a path that can't be read is a 404.
+    file_path = os.path.join(path_mapper.to_local(payload.search_path), payload.folders_to_search)
+    try:
+        scan, cached = await run_blocking(scan_folder, file_path, payload.refresh)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"An Error Occurred with searching the path: {file_path}.")
+    return {"search_path": file_path,
+            "files_found": compact_listing(scan),
+            "sequences": scan["sequences"],
+            "cached": cached}
+
+
+@app.post("/v2/ingest_request", response_model=IngestResponse, response_class=FastJSONResponse)
+async def ingest_request_v2(payload: IngestRequest):
+    try:
+        result = await run_blocking(run_ingest, model_data(payload))
+    except ValueError as e:  # Unknown dedup/verify/frames mode.
+        raise HTTPException(status_code=422, detail=str(e))
+    return result
+
+
+@app.post("/v2/ingest_batch", response_model=IngestBatchResponse, response_class=FastJSONResponse)
+async def ingest_batch_v2(payload: IngestBatchRequest):
+    return await run_blocking(run_ingest_batch, model_data(payload))
+
+
+@app.post("/jobs/ingest_batch")
+async def submit_ingest_batch_job(request: Request):
+    # Same payload as /ingest_batch.
+    data = await read_payload(request)
+    return {"job_id": await run_blocking(job_queue.submit, "ingest_batch", data)}
+
+
+@app.post("/jobs/create_workspace")
+async def submit_create_workspace_job(request: Request):
+    # Same payload as /create_workspace.
+    data = await read_payload(request)
+    return {"job_id": await run_blocking(job_queue.submit, "create_workspace", data)}
+
+
+@app.get("/jobs")
+async def list_jobs(status: str = None, limit: int = 100):
+    return {"jobs": await run_blocking(job_queue.list, status, limit)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    # status, progress (frames_done, frames_total, bytes_done, eta_seconds), result and error of a job.
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    status = await run_blocking(job_queue.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return {"job_id": job_id, "status": status}
+
+
 if __name__ == "__main__":
     # Run the app with Uvicorn as the ASGI server
     import uvicorn
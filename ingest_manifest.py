@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from version_allocator import highest_version, format_version
+
+try:
+    import xxhash
+except ImportError:  # Optional, BLAKE2 from hashlib is used without it.
+    xxhash = None
+
+# Written into every version folder ingested with dedup on, describes the source of each file in it.
+MANIFEST_NAME = ".ingest_manifest.json"
+HASH_ALGORITHM = "xxh3_128" if xxhash is not None else "blake2b"
+HASH_CHUNK_SIZE = 16 * 1024 * 1024  # Large files are hashed as chunks of this size in parallel.
+HASH_READ_SIZE = 4 * 1024 * 1024  # Large reads keep SMB/NFS round trips down.
+# "off" copies everything, "skip" skips an ingest identical to the latest version, "link" also hardlinks
+# the unchanged files of a changed ingest from the latest version and only copies the changed ones.
+DEDUP_MODES = ("off", "skip", "link")
+# "full" checks the size and hash of every copied file, "fast" every size but only hashes VERIFY_SAMPLES files.
+VERIFY_MODES = ("off", "fast", "full")
+VERIFY_SAMPLES = 16
+
+
+def new_hash():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_chunk(path, offset, length):
+    digest = new_hash()
+    buffer = memoryview(bytearray(min(length, HASH_READ_SIZE)))
+    with open(path, "rb", buffering=0) as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            read = f.readinto(buffer[:min(remaining, len(buffer))])
+            if not read:
+                break
+            digest.update(buffer[:read])
+            remaining -= read
+    return digest.digest()
+
+
+def hash_files(sizes, workers=8):
+    """
+    Hashes many files on a thread pool, large files split into HASH_CHUNK_SIZE chunks hashed in parallel.
+
+    Args:
+        sizes (dict): path -> size in bytes.
+        workers (int): Chunks hashed at once.
+
+    Returns:
+        dict: path -> hex digest. A file of several chunks gets the hash of its chunk hashes.
+    """
+    chunks = [(path, offset) for path, size in sizes.items() for offset in range(0, max(size, 1), HASH_CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="hash") as executor:
+        digests = executor.map(lambda chunk: hash_chunk(chunk[0], chunk[1], HASH_CHUNK_SIZE), chunks)
+        by_path = {}
+        for (path, _), digest in zip(chunks, digests):
+            by_path.setdefault(path, []).append(digest)
+    hashes = {}
+    for path, path_digests in by_path.items():
+        if len(path_digests) == 1:
+            hashes[path] = path_digests[0].hex()
+        else:
+            combined = new_hash()
+            for digest in path_digests:
+                combined.update(digest)
+            hashes[path] = combined.hexdigest()
+    return hashes
+
+
+def describe_sources(sources, previous=None, workers=8, source_hashes=None):
+    """
+    Size, mtime and hash of every source file of an ingest.
+
+    A file whose size and mtime match its entry in the previous manifest or in source_hashes keeps that hash
+    without being read.
+
+    Args:
+        sources (dict): source name -> source path.
+        previous (dict, optional): The latest version's manifest.
+        workers (int): Chunks hashed at once.
+        source_hashes (dict, optional): source path -> (size, mtime_ns, hash) shared by several ingests,
+                                        the files hashed here are added to it.
+
+    Returns:
+        tuple: ({source name: {"size", "mtime_ns", "hash"}}, number of files that had to be hashed)
+    """
+    known = {}
+    if previous is not None:
+        known = {entry["source"]: entry for entry in previous["files"].values()}
+    if source_hashes is None:
+        source_hashes = {}
+    entries = {}
+    to_hash = {}
+    for name, path in sources.items():
+        stat = os.stat(path)
+        entries[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": None}
+        old = known.get(name)
+        shared = source_hashes.get(path)
+        if old is not None and old["hash"] and (old["size"], old["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            entries[name]["hash"] = old["hash"]
+        elif shared is not None and shared[:2] == (stat.st_size, stat.st_mtime_ns):
+            entries[name]["hash"] = shared[2]
+        else:
+            to_hash[path] = stat.st_size
+    hashes = hash_files(to_hash, workers)
+    for name, path in sources.items():
+        if path in hashes:
+            entries[name]["hash"] = hashes[path]
+            source_hashes[path] = (entries[name]["size"], entries[name]["mtime_ns"], hashes[path])
+    return entries, len(to_hash)
+
+
+def latest_manifest(parent):
+    """
+    Reads the manifest of the highest vXXXX folder in parent.
+
+    Returns:
+        tuple: (version folder, manifest), (None, None) when there is no version, no manifest or the
+               manifest was hashed with another algorithm.
+    """
+    number = highest_version(parent)
+    if not number:
+        return None, None
+    version_path = os.path.join(parent, format_version(number))
+    try:
+        with open(os.path.join(version_path, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, None
+    if manifest.get("algorithm") != HASH_ALGORITHM:
+        return None, None
+    return version_path, manifest
+
+
+def same_sources(manifest, entries):
+    # True when the manifest was made from exactly these source files with the same content.
+    previous = {entry["source"]: entry["hash"] for entry in manifest["files"].values()}
+    return previous == {name: entry["hash"] for name, entry in entries.items()}
+
+
+def unchanged_files(manifest, entries):
+    # source name -> file name in the manifest's version, for the sources whose content hasn't changed.
+    unchanged = {}
+    for file_name, entry in manifest["files"].items():
+        current = entries.get(entry["source"])
+        if current is not None and current["hash"] == entry["hash"]:
+            unchanged[entry["source"]] = file_name
+    return unchanged
+
+
+def write_manifest(folder, source_path, files, verification=None, frames=None):
+    # files: file name in folder -> {"source", "size", "mtime_ns", "hash"}, hash is None for unhashed files.
+    # frames is the frame mode the files were named with. Written atomically.
+    manifest = {"algorithm": HASH_ALGORITHM, "source_path": source_path, "created": time.time(), "files": files,
+                "frames": frames, "verification": verification}
+    path = os.path.join(folder, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def link_files(link_operations):
+    """
+    Hardlinks (existing path, new path) pairs. Published versions are never edited in place, so sharing
+    their frames between versions is safe.
+
+    Returns:
+        list: The pairs that could not be linked (other filesystem, no hardlink support) and need a copy.
+    """
+    failed = []
+    for existing_path, new_path in link_operations:
+        try:
+            os.link(existing_path, new_path)
+        except OSError:
+            failed.append((existing_path, new_path))
+    return failed
+
+
+def sample_indexes(count, samples):
+    # samples indexes spread evenly over range(count), always including the first and last.
+    if count <= samples:
+        return range(count)
+    if samples <= 1:
+        return [0]
+    return sorted({round(index * (count - 1) / (samples - 1)) for index in range(samples)})
+
+
+def stat_copy(operation):
+    # (source, destination, source stat, destination size or None when it's missing) of one copy.
+    source_path, destination_path = operation
+    source_stat = os.stat(source_path)
+    try:
+        destination_size = os.stat(destination_path).st_size
+    except FileNotFoundError:
+        destination_size = None
+    return source_path, destination_path, source_stat, destination_size
+
+
+def verify_copies(copy_operations, mode="full", known_hashes=None, samples=VERIFY_SAMPLES, workers=8):
+    """
+    Checks copied files against their sources.
+
+    Every destination must exist with its source's size, both are stat'ed on a pool as the round trips add up
+    on network storage. Then the source and destination of every file ("full") or of samples files spread over
+    the copy ("fast") are hashed, all on one pool so both sides are read concurrently.
+
+    Args:
+        copy_operations (list): (source path, destination path) pairs that were copied.
+        mode (str): "full" or "fast".
+        known_hashes (dict, optional): source path -> hash already computed, those sources aren't read again.
+        samples (int): Files hashed in "fast" mode.
+        workers (int): Chunks hashed at once.
+
+    Returns:
+        tuple: ({destination path: {"size", "mtime_ns", "hash"}} with the source's mtime and a None hash for
+               unhashed files, stats with the mode, checked/hashed counts, bytes_hashed, seconds and mismatches)
+    """
+    started = time.perf_counter()
+    known_hashes = known_hashes or {}
+    checks = {}
+    mismatches = []
+    sized = []  # (source, destination, size) of the copies with matching sizes
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="verify-stat") as executor:
+        stats = list(executor.map(stat_copy, copy_operations))
+    for source_path, destination_path, source_stat, destination_size in stats:
+        if destination_size is None:
+            mismatches.append(f"{destination_path}: missing")
+            continue
+        checks[destination_path] = {"size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns, "hash": None}
+        if destination_size != source_stat.st_size:
+            mismatches.append(f"{destination_path}: {destination_size} bytes, the source has {source_stat.st_size}")
+            continue
+        sized.append((source_path, destination_path, source_stat.st_size))
+
+    if mode == "fast":
+        sized = [sized[index] for index in sample_indexes(len(sized), samples)]
+    to_hash = {}
+    for source_path, destination_path, size in sized:
+        to_hash[destination_path] = size
+        if source_path not in known_hashes:
+            to_hash[source_path] = size
+    hashes = {**known_hashes, **hash_files(to_hash, workers)}
+    for source_path, destination_path, _ in sized:
+        if hashes[source_path] != hashes[destination_path]:
+            mismatches.append(f"{destination_path}: content differs from {source_path}")
+        else:
+            checks[destination_path]["hash"] = hashes[destination_path]
+
+    return checks, {
+        "mode": mode,
+        "checked": len(copy_operations),
+        "hashed": len(sized),
+        "bytes_hashed": sum(to_hash.values()),
+        "seconds": round(time.perf_counter() - started, 3),
+        "mismatches": mismatches,
+    }
@@ -0,0 +1,188 @@
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+
+# Job states, a job moves queued -> running -> done/failed/cancelled.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+PROGRESS_SAVE_INTERVAL = 1.0  # Seconds between progress writes to the database while a job runs.
+
+
+def skipped_work(result):
+    # True when a handler's result shows files it skipped, the "copy_stats" of the ingest handlers.
+    copy_stats = result.get("copy_stats") if isinstance(result, dict) else None
+    return bool(copy_stats and copy_stats.get("skipped"))
+
+
+class Job:
+    """
+    Handle passed to a job handler so it can report progress and check for cancellation.
+    """
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.cancel_event = threading.Event()
+        self.progress = {}
+        self._last_saved = 0.0
+
+    def report(self, **progress):
+        self.progress.update(progress)
+        now = time.monotonic()
+        if now - self._last_saved >= PROGRESS_SAVE_INTERVAL:
+            self._last_saved = now
+            self.job_queue._update(self.job_id, progress=json.dumps(self.progress))
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+class JobQueue:
+    """
+    Runs long filesystem jobs on a worker pool, persisted in SQLite so queued jobs survive a restart.
+
+    handlers maps a job kind to a callable handler(data, job) returning a JSON serialisable result.
+    A cancelled job only ends up cancelled when its result shows skipped work, a cancel that came after
+    the last file leaves it done.
+    A job that was running when the server stopped is marked failed rather than re-run, as it may
+    have left a partially written version behind.
+    """
+
+    def __init__(self, path, handlers, workers=2):
+        self.handlers = handlers
+        self.workers = workers
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "id TEXT PRIMARY KEY, kind TEXT, payload TEXT, status TEXT, progress TEXT, result TEXT, "
+                         "error TEXT, created REAL, started REAL, finished REAL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._running = {}  # job id -> Job
+        self._threads = []
+
+    def start(self):
+        self._execute("UPDATE jobs SET status = ?, error = ?, finished = ? WHERE status = ?",
+                      (FAILED, "Interrupted by a server restart.", time.time(), RUNNING))
+        for (job_id,) in self._execute("SELECT id FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)):
+            self._pending.put(job_id)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for job in list(self._running.values()):
+            job.cancel_event.set()
+        for _ in self._threads:
+            self._pending.put(None)
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        with self._lock:
+            self._db.close()
+
+    def submit(self, kind, data):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        self._execute("INSERT INTO jobs (id, kind, payload, status, progress, created) VALUES (?, ?, ?, ?, ?, ?)",
+                      (job_id, kind, json.dumps(data), QUEUED, "{}", time.time()))
+        self._pending.put(job_id)
+        return job_id
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = self._row_to_dict(rows[0])
+        running = self._running.get(job_id)
+        if running is not None:
+            job["progress"] = dict(running.progress)  # Fresher than the throttled copy in the database.
+        return job
+
+    def list(self, status=None, limit=100):
+        if status:
+            rows = self._execute("SELECT * FROM jobs WHERE status = ? ORDER BY created DESC LIMIT ?", (status, limit))
+        else:
+            rows = self._execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+        return [self._row_to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        # Returns the new status, or None if the job doesn't exist.
+        job = self.get(job_id)
+        if job is None:
+            return None
+        # Only a job still queued is cancelled here, a worker may claim it at the same time (see _work).
+        if job["status"] == QUEUED and self._update(job_id, QUEUED, status=CANCELLED, finished=time.time()):
+            return CANCELLED
+        running = self._running.get(job_id)
+        if running is not None:
+            running.cancel_event.set()
+        return self.get(job_id)["status"]
+
+    def _work(self):
+        while True:
+            job_id = self._pending.get()
+            if job_id is None:
+                return
+            # Registered before the claim, so a cancel that finds the job running can always reach it.
+            job = Job(self, job_id)
+            self._running[job_id] = job
+            # Claimed in one statement, a cancel between a check and the update would be overwritten.
+            if not self._update(job_id, QUEUED, status=RUNNING, started=time.time()):
+                del self._running[job_id]
+                continue  # Cancelled while it was waiting.
+            kind, payload = self._execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,))[0]
+            try:
+                result = self.handlers[kind](json.loads(payload), job)
+                status = CANCELLED if job.cancelled() and skipped_work(result) else DONE
+                self._update(job_id, status=status, result=json.dumps(result), progress=json.dumps(job.progress),
+                             finished=time.time())
+            except Exception as e:
+                self._update(job_id, status=FAILED, error=str(e), progress=json.dumps(job.progress),
+                             finished=time.time())
+            finally:
+                del self._running[job_id]
+
+    def _execute(self, statement, parameters=()):
+        with self._lock:
+            rows = self._db.execute(statement, parameters).fetchall()
+            self._db.commit()
+            return rows
+
+    def _update(self, job_id, expected_status=None, **columns):
+        # Returns False when the job doesn't exist or, with expected_status, is in another state.
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        statement = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        parameters = (*columns.values(), job_id)
+        if expected_status is not None:
+            statement += " AND status = ?"
+            parameters += (expected_status,)
+        with self._lock:
+            updated = self._db.execute(statement, parameters).rowcount
+            self._db.commit()
+        return updated > 0
+
+    @staticmethod
+    def _row_to_dict(row):
+        job_id, kind, payload, status, progress, result, error, created, started, finished = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "progress": json.loads(progress) if progress else {},
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created": created,
+            "started": started,
+            "finished": finished,
+        }
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import ntpath
+from pathlib import PurePosixPath, PureWindowsPath
+
+# Storage roots by name, each with its mount point per platform. The Windows ones are the original drives.
+DEFAULT_ROOTS = {
+    "temp": {"windows": "T:\\", "linux": "/mnt/temp", "darwin": "/Volumes/temp"},
+    "project": {"windows": "P:\\", "linux": "/mnt/projects", "darwin": "/Volumes/projects"},
+}
+
+
+def current_platform():
+    if sys.platform.startswith("win"):
+        return "windows"
+    if sys.platform == "darwin":
+        return "darwin"
+    return "linux"
+
+
+def pure_path(path):
+    # Paths with a drive letter or UNC share are parsed as Windows paths whatever OS this runs on.
+    path = str(path)
+    if ntpath.splitdrive(path)[0]:
+        return PureWindowsPath(path)
+    return PurePosixPath(path.replace("\\", "/"))
+
+
+def load_roots(config=""):
+    """
+    Reads the storage root map, merged over DEFAULT_ROOTS.
+
+    Args:
+        config (str): A JSON object or the path of a JSON file, e.g.
+                      {"project": {"linux": "/srv/projects"}, "cache": "/mnt/cache"}.
+                      A plain string root is used on every platform. "" keeps the defaults.
+
+    Returns:
+        dict: root name -> {platform: root path}
+    """
+    roots = {name: dict(platforms) for name, platforms in DEFAULT_ROOTS.items()}
+    if not config:
+        return roots
+    if os.path.isfile(config):
+        with open(config, "r") as f:
+            overrides = json.load(f)
+    else:
+        overrides = json.loads(config)
+    for name, platforms in overrides.items():
+        if isinstance(platforms, str):
+            platforms = {platform: platforms for platform in ("windows", "linux", "darwin")}
+        roots.setdefault(name, {}).update(platforms)
+    return roots
+
+
+class PathMapper:
+    """
+    Maps paths between the per-platform mount points of the named storage roots.
+
+    A path written on any platform (T:\\PROJ_ABC\\ingest, T:/PROJ_ABC/ingest, /mnt/temp/PROJ_ABC/ingest)
+    resolves to the same folder on the platform this runs on, so the server can run on Windows or
+    directly on the Linux file servers.
+    """
+
+    def __init__(self, roots, platform=None):
+        self.roots = roots
+        self.platform = platform or current_platform()
+        # (root name, parsed root) for every platform, longest first so nested roots win.
+        self._candidates = sorted(((name, pure_path(root)) for name, platforms in roots.items()
+                                   for root in platforms.values() if root),
+                                  key=lambda candidate: len(candidate[1].parts), reverse=True)
+
+    def root(self, name):
+        try:
+            return pure_path(self.roots[name][self.platform])
+        except KeyError:
+            raise KeyError(f"No {self.platform} path configured for storage root: {name}") from None
+
+    def join(self, name, *parts):
+        # Local path of parts inside a storage root, as a string.
+        return str(self.root(name).joinpath(*parts))
+
+    def split(self, path):
+        """
+        Splits a path from any platform into its storage root and the parts below it.
+
+        Returns:
+            tuple: (root name, parts), root name is None when the path is not inside a known root.
+        """
+        parsed = pure_path(path)
+        for name, root in self._candidates:
+            if type(root) is not type(parsed):
+                continue
+            try:
+                return name, parsed.relative_to(root).parts
+            except ValueError:
+                continue
+        return None, parsed.parts
+
+    def to_local(self, path):
+        # The same location on this platform, paths outside every root are returned unchanged.
+        name, parts = self.split(path)
+        if name is None:
+            return str(path)
+        return self.join(name, *parts)
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from sequence_scanner import scan_sequences
+
+try:
+    import inotify_simple
+except ImportError:  # Only needed for ScanIndexWatcher, which is Linux only.
+    inotify_simple = None
+
+# A directory modified this close to its scan may have changed within the same mtime tick
+# (SMB and FAT report coarse mtimes), so it is not trusted until it is older than this.
+MTIME_GRACE_NS = 2 * 1_000_000_000
+# Bumped whenever scan_sequences() groups files differently or the table changes, an index from another
+# version is dropped on open.
+SCAN_FORMAT_VERSION = 3
+
+
+class ScanIndex:
+    """
+    SQLite index of scan_sequences() results keyed by directory path and mtime.
+
+    An unchanged directory is answered from the index, a changed one is rescanned in full: a file
+    overwritten in place keeps its name, so sizes from an earlier scan can't be trusted without a stat.
+    scanner is called like scan_sequences(directory), e.g. to scan in another process.
+    """
+
+    def __init__(self, path, scanner=scan_sequences):
+        self.path = path
+        self.scanner = scanner
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCAN_FORMAT_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS directories")
+            self._db.execute(f"PRAGMA user_version = {SCAN_FORMAT_VERSION}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS directories ("
+                         "path TEXT PRIMARY KEY, mtime_ns INTEGER, scanned_ns INTEGER, result TEXT)")
+        self._db.commit()
+
+    def scan(self, directory, refresh=False):
+        """
+        Returns the sequence scan of a directory.
+
+        Args:
+            directory (str): The directory to scan.
+            refresh (bool): Ignore the indexed result and rescan every file.
+
+        Returns:
+            tuple: (scan_sequences() result, True if it came from the index)
+        """
+        key = os.path.normpath(directory)
+        mtime_ns = os.stat(key).st_mtime_ns
+        with self._lock:
+            row = self._db.execute("SELECT mtime_ns, scanned_ns, result FROM directories WHERE path = ?",
+                                   (key,)).fetchone()
+        if row is not None and not refresh:
+            indexed_mtime_ns, scanned_ns, result = row
+            if indexed_mtime_ns == mtime_ns and scanned_ns - mtime_ns > MTIME_GRACE_NS:
+                return json.loads(result), True
+
+        return self._rescan(key), False
+
+    def _rescan(self, key):
+        scanned_ns = time.time_ns()
+        mtime_ns = os.stat(key).st_mtime_ns  # Taken before the listing so a change during the scan is seen next time.
+        result = self.scanner(key)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO directories (path, mtime_ns, scanned_ns, result) "
+                             "VALUES (?, ?, ?, ?)",
+                             (key, mtime_ns, scanned_ns, json.dumps(result)))
+            self._db.commit()
+        return result
+
+    def refresh(self, directory):
+        # Rescan a directory that is known to have changed.
+        return self._rescan(os.path.normpath(directory))
+
+    def forget(self, directory):
+        with self._lock:
+            self._db.execute("DELETE FROM directories WHERE path = ?", (os.path.normpath(directory),))
+            self._db.commit()
+
+    def directories(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT path FROM directories")]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ScanIndexWatcher:
+    """
+    Keeps indexed directories fresh with inotify, rescanning a directory as soon as files in it change.
+
+    Needs Linux and the optional inotify_simple package. inotify only sees changes made on the local
+    machine, so on network shares the mtime check in ScanIndex.scan() is still what catches changes.
+    """
+
+    FLAGS = ("CREATE", "DELETE", "MOVED_FROM", "MOVED_TO", "CLOSE_WRITE")
+
+    def __init__(self, index, settle=1.0):
+        if inotify_simple is None:
+            raise RuntimeError("ScanIndexWatcher needs the inotify_simple package.")
+        self.index = index
+        self.settle = settle  # Seconds to wait for more events before rescanning, frames arrive in bursts.
+        self._inotify = inotify_simple.INotify()
+        self._mask = 0
+        for flag in self.FLAGS:
+            self._mask |= getattr(inotify_simple.flags, flag)
+        self._watches = {}  # watch descriptor -> directory
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, directory):
+        directory = os.path.normpath(directory)
+        if directory in self._watches.values():
+            return
+        try:
+            self._watches[self._inotify.add_watch(directory, self._mask)] = directory
+        except OSError as e:
+            print(f"Could not watch {directory}: {e}")
+
+    def start(self):
+        for directory in self.index.directories():
+            self.watch(directory)
+        self._thread = threading.Thread(target=self._run, name="scan-index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._inotify.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            changed = {self._watches.get(event.wd) for event in self._inotify.read(timeout=1000)}
+            if not changed:
+                continue
+            # Collect the rest of the burst so a sequence being copied in is only rescanned once.
+            while True:
+                events = self._inotify.read(timeout=int(self.settle * 1000))
+                if not events or self._stop.is_set():
+                    break
+                changed.update(self._watches.get(event.wd) for event in events)
+            for directory in changed - {None}:
+                try:
+                    self.index.refresh(directory)
+                except OSError as e:
+                    print(f"Could not rescan {directory}: {e}")
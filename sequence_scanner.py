@@ -0,0 +1,291 @@
+import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the pure Python path gives the same results.
+    np = None
+
+DIGITS = "0123456789"
+# How a folder ingest numbers its frames: "offset" moves the first frame to the start frame and keeps the
+# spacing (holes stay holes), "preserve" keeps the original numbers, "renumber" counts up from the start frame.
+FRAME_MODES = ("offset", "preserve", "renumber")
+# scandir already returns file sizes on Windows, everywhere else each size is a stat (a round trip on SMB/NFS).
+SIZES_ARE_FREE = os.name == "nt"
+# Frame numbers are held in int64 arrays. Longer digit runs are ids or timestamps rather than frames
+# (e.g. render_20240101123045123456789.exr) and those names are listed as other files.
+MAX_FRAME_DIGITS = 18
+
+
+def split_frame_name(name):
+    """
+    Splits a name into {base}{frame digits}{.ext}, the same split as the r"^(.*?)(\d+)(\.\w+)$" regex
+    but using str methods, which is several times faster per file.
+
+    Returns:
+        tuple: (base, digits, ext) or None if the name has no frame number.
+    """
+    dot = name.rfind(".")
+    if dot <= 0:
+        return None
+    ext = name[dot:]
+    if len(ext) < 2 or not ext[1:].replace("_", "a").isalnum():
+        return None
+    stem = name[:dot]
+    base = stem.rstrip(DIGITS)
+    if len(base) == len(stem):
+        return None
+    return base, stem[len(base):], ext
+
+
+def merge_paddings(groups):
+    """
+    Joins groups of names that only differ in their digit count into one sequence when the longer names
+    are just frame numbers outgrowing the padding, e.g. plate.9999.exr followed by plate.10000.exr.
+
+    Args:
+        groups (dict): (base, digit count, ext) -> [array of frame numbers, total bytes, True if a name has
+                       a leading zero].
+
+    Returns:
+        list: (base, padding, ext, frames, total bytes), the padding being the shortest digit count.
+              Groups whose longer names have leading zeros (e.g. plate.0001.exr and plate.00001.exr) stay apart.
+    """
+    by_name = {}
+    for (base, padding, ext), (frames, total_bytes, leading_zero) in groups.items():
+        by_name.setdefault((base, ext), []).append((padding, frames, total_bytes, leading_zero))
+    merged = []
+    for (base, ext), paddings in by_name.items():
+        paddings.sort(key=lambda group: group[0])
+        if len(paddings) > 1 and not any(leading_zero for _, _, _, leading_zero in paddings[1:]):
+            frames = array("q")
+            for _, group_frames, _, _ in paddings:
+                frames.extend(group_frames)
+            merged.append((base, paddings[0][0], ext, frames, sum(group[2] for group in paddings)))
+        else:
+            merged.extend((base, padding, ext, frames, total_bytes) for padding, frames, total_bytes, _ in paddings)
+    return merged
+
+
+def scan_sequences(directory, extension_filter=None, with_sizes=None):
+    """
+    Scans a directory once and groups numbered files into frame sequences.
+
+    Args:
+        directory (str): The directory to scan.
+        extension_filter (str, optional): Only consider names ending with this (e.g. '.exr').
+        with_sizes (bool, optional): Sum the file sizes of each sequence. Costs a stat per file on POSIX,
+                                     so by default sizes are only collected where they are free (SIZES_ARE_FREE).
+
+    Returns:
+        dict: {"sequences": [descriptor, ...], "files": [{"name": str, "bytes": int}, ...]}
+              Each sequence descriptor holds base, padding, ext, frame ranges, holes, count and total bytes.
+              Without sizes total_bytes and bytes are None.
+              Names sharing a base but with a different extension are separate sequences, as are different
+              paddings unless the longer names are frames past the padding (see merge_paddings).
+              Names with more than MAX_FRAME_DIGITS digits are other files.
+    """
+    if with_sizes is None:
+        with_sizes = SIZES_ARE_FREE
+    groups = {}  # (base, digit count, ext) -> [array of frame numbers, total bytes, any leading zero]
+    other_files = []
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if extension_filter and not name.endswith(extension_filter):
+                continue
+            is_file = entry.is_file()
+            parts = split_frame_name(name) if is_file else None
+            size = 0
+            if with_sizes and is_file:
+                size = entry.stat().st_size
+            if parts is None or len(parts[1]) > MAX_FRAME_DIGITS:
+                other_files.append({"name": name, "bytes": size if with_sizes else None})
+                continue
+            base, digits, ext = parts
+            key = (base, len(digits), ext)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [array("q"), 0, False]
+            group[0].append(int(digits))
+            group[1] += size
+            if digits[0] == "0":
+                group[2] = True
+
+    sequences = [describe_sequence(base, padding, ext, frames, total_bytes if with_sizes else None)
+                 for base, padding, ext, frames, total_bytes in merge_paddings(groups)]
+    return {"sequences": sequences, "files": other_files}
+
+
+def frame_ranges(frames):
+    """
+    Collapses frame numbers into inclusive (start, end) ranges.
+
+    Args:
+        frames (array): Frame numbers in any order.
+
+    Returns:
+        list: Sorted [start, end] pairs of consecutive frames.
+    """
+    if not frames:
+        return []
+    if np is not None:
+        values = np.unique(np.frombuffer(frames, dtype=np.int64))
+        breaks = np.flatnonzero(np.diff(values) != 1)
+        starts = values[np.concatenate(([0], breaks + 1))]
+        ends = values[np.concatenate((breaks, [len(values) - 1]))]
+        return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+    values = sorted(set(frames))
+    ranges = [[values[0], values[0]]]
+    for frame in values[1:]:
+        if frame == ranges[-1][1] + 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return ranges
+
+
+def describe_sequence(base, padding, ext, frames, total_bytes=0):
+    ranges = frame_ranges(frames)
+    holes = [[previous[1] + 1, current[0] - 1] for previous, current in zip(ranges, ranges[1:])]
+    first, last = ranges[0][0], ranges[-1][1]
+    return {
+        "base": base,
+        "padding": padding,
+        "ext": ext,
+        "first": f"{base}{str(first).zfill(padding)}{ext}",
+        "last": f"{base}{str(last).zfill(padding)}{ext}",
+        "frames": ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges),
+        "ranges": ranges,
+        "holes": holes,
+        "count": len(frames),
+        "total_bytes": total_bytes,
+    }
+
+
+def compact_listing(scan):
+    """
+    Converts a scan_sequences() result to the listing shape used by the prompts.
+
+    Returns:
+        list: (first, last) tuples for sequences, plain names for single frames and other files.
+    """
+    compact_files = []
+    for sequence in scan["sequences"]:
+        if sequence["count"] > 1:
+            compact_files.append((sequence["first"], sequence["last"]))
+        else:
+            compact_files.append(sequence["first"])
+    compact_files.extend(file["name"] for file in scan["files"])
+    return compact_files
+
+
+def sorted_frames(frames):
+    # Sorted copy of an array("q") of frame numbers, without turning it into a list of Python ints with numpy.
+    if np is not None:
+        return array("q", np.sort(np.frombuffer(frames, dtype=np.int64)).tobytes())
+    return array("q", sorted(frames))
+
+
+class FrameListing:
+    """
+    The files of a folder ingest, with the numbered ones grouped into sequences of sorted integer arrays.
+
+    Names are rebuilt from base, padding and frame number when they are iterated, so a huge sequence is
+    held as 8 bytes per frame rather than a list of names.
+    """
+
+    def __init__(self, sequences, other_files):
+        self.sequences = sequences  # [(base, padding, ext, sorted array of frame numbers)], sorted by base
+        self.other_files = other_files  # Sorted names that are not part of a sequence.
+
+    def __len__(self):
+        if not self.sequences:
+            return len(self.other_files)
+        return sum(len(frames) for _, _, _, frames in self.sequences)
+
+    def ignored_files(self):
+        # Files next to a sequence that are not part of it (no frame number, or a lone numbered file with
+        # another name) are left out of the ingest.
+        return self.other_files if self.sequences else []
+
+    def renumber(self, mode="offset", start=1001):
+        """
+        Yields every source name in frame order with its new frame number.
+
+        Several distinct sequences in one folder can't keep their numbers without clashing, so they are
+        renumbered one after the other whatever the mode. A folder without numbered files is renumbered
+        in name order.
+
+        Args:
+            mode (str): One of FRAME_MODES. "preserve" keeps the source padding, the others pad to 4 digits.
+            start (int): First frame for "offset" and "renumber".
+
+        Yields:
+            tuple: (source name, zero padded frame number string)
+        """
+        if mode not in FRAME_MODES:
+            raise ValueError(f"Unknown frame mode: {mode}")
+        if not self.sequences:
+            for index, name in enumerate(self.other_files):
+                yield name, str(start + index).zfill(4)
+            return
+        if len(self.sequences) > 1:
+            mode = "renumber"
+        number = start
+        for base, padding, ext, frames in self.sequences:
+            offset = start - frames[0] if mode == "offset" else 0
+            new_padding = padding if mode == "preserve" else 4  # Moved frames get the usual 4 digit padding.
+            for frame in frames:
+                if mode == "renumber":
+                    new_frame = number
+                    number += 1
+                else:
+                    new_frame = frame + offset
+                yield f"{base}{str(frame).zfill(padding)}{ext}", str(new_frame).zfill(new_padding)
+
+
+def list_frames(directory, extension_filter=None):
+    """
+    Lists a folder for a sequence ingest in a single scandir pass.
+
+    Args:
+        directory (str): The folder to list.
+        extension_filter (str, optional): Only consider names ending with this (e.g. '.exr').
+
+    Returns:
+        FrameListing: The sequences sorted by base with their frames sorted, and the other files. When the
+                      folder has a sequence of several frames, single numbered files are other files too,
+                      as are names with more than MAX_FRAME_DIGITS digits.
+    """
+    groups = {}  # (base, digit count, ext) -> [array of frame numbers, total bytes, any leading zero]
+    other_files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if extension_filter and not name.endswith(extension_filter):
+                continue
+            if not entry.is_file():
+                continue
+            parts = split_frame_name(name)
+            if parts is None or len(parts[1]) > MAX_FRAME_DIGITS:
+                other_files.append(name)
+                continue
+            base, digits, ext = parts
+            key = (base, len(digits), ext)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [array("q"), 0, False]
+            group[0].append(int(digits))
+            if digits[0] == "0":
+                group[2] = True
+    sequences = [(base, padding, ext, sorted_frames(frames))
+                 for base, padding, ext, frames, _ in sorted(merge_paddings(groups), key=lambda group: group[:3])]
+    if any(len(frames) > 1 for _, _, _, frames in sequences):
+        # A stray numbered file (e.g. a slate.0000.exr next to the plate) would otherwise force a renumber.
+        other_files.extend(f"{base}{str(frames[0]).zfill(padding)}{ext}"
+                           for base, padding, ext, frames in sequences if len(frames) == 1)
+        sequences = [sequence for sequence in sequences if len(sequence[3]) > 1]
+    return FrameListing(sequences, sorted(other_files))
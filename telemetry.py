@@ -0,0 +1,190 @@
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Header carrying the id of one chat turn from the Pipeline through every request it makes.
+CORRELATION_HEADER = "X-Correlation-ID"
+# Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a cached scan up to a large sequence copy.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# The correlation id and stage spans of the request being handled. run_blocking() copies them into its worker thread.
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+current_spans = contextvars.ContextVar("current_spans", default=None)
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric family with optional labels. Label values are passed as keyword arguments.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        # (name suffix, label values, extra labels, value) of every series.
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.label_names, key, extra)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only go up.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._values.items():
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    samples.append(("_bucket", key, (("le", format_value(float(bound))),), count))
+                samples.append(("_bucket", key, (("le", "+Inf"),), series["count"]))
+                samples.append(("_sum", key, (), series["sum"]))
+                samples.append(("_count", key, (), series["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics served by /metrics, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+request_seconds = registry.histogram("vfx_http_request_seconds", "Time to answer an HTTP request.",
+                                     ("method", "endpoint", "status"))
+stage_seconds = registry.histogram("vfx_stage_seconds", "Time spent in each stage of a request or job.", ("stage",))
+files_written = registry.counter("vfx_files_written_total", "Files written by ingests and workspace templates.",
+                                 ("kind", "method"))
+bytes_written = registry.counter("vfx_bytes_written_total", "Bytes written by ingests and workspace templates.",
+                                 ("kind", "method"))
+copy_errors = registry.counter("vfx_copy_errors_total", "Files that failed to copy.", ("kind",))
+cache_lookups = registry.counter("vfx_cache_lookups_total", "Cache lookups by cache and hit or miss.",
+                                 ("cache", "result"))
+event_loop_lag = registry.gauge("vfx_event_loop_lag_seconds", "How late the event loop woke a sleeping task.",
+                                ("stat",))
+
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        cache_lookups.inc(hits, cache=cache, result="hit")
+    if misses:
+        cache_lookups.inc(misses, cache=cache, result="miss")
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a stage into vfx_stage_seconds and adds it to the spans of the current request, if any.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        stage_seconds.observe(seconds, stage=stage)
+        spans = current_spans.get()
+        if spans is not None:
+            spans.append((stage, seconds))
+
+
+def server_timing(spans):
+    # Server-Timing header value, e.g. "scan;dur=12.5, copy;dur=840.1" in milliseconds.
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in spans)
@@ -0,0 +1,255 @@
+import os
+import time
+import errno
+import shutil
+import fnmatch
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from copy_engine import copy_file
+
+try:
+    import fcntl
+except ImportError:  # Windows, reflinks are only tried on Linux.
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl that reflinks a whole file on btrfs, XFS and other copy-on-write filesystems.
+HASH_CHUNK_SIZE = 1024 * 1024
+# Errors that mean "this filesystem can't link/reflink these files", not that the clone failed.
+_LINK_FALLBACK_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EOPNOTSUPP, errno.EPERM, errno.EMLINK,
+                         getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+CLONE_MODES = ("copy", "clone")
+
+
+def hash_file(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink_file(source_path, destination_path):
+    # Returns False when the filesystem can't reflink, the caller then falls back to another strategy.
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+    except OSError as e:
+        if e.errno not in _LINK_FALLBACK_ERRORS:
+            raise
+        os.remove(destination_path)
+        return False
+    shutil.copystat(source_path, destination_path)
+    return True
+
+
+def hardlink_file(source_path, destination_path):
+    try:
+        os.link(source_path, destination_path)
+    except OSError as e:
+        if e.errno not in _LINK_FALLBACK_ERRORS:
+            raise
+        return False
+    return True
+
+
+class TemplateIndex:
+    def __init__(self, root, directories, files, folder_mtimes=None):
+        self.root = root
+        self.directories = directories  # Relative paths, parents before their children.
+        self.files = files  # relative path -> (size, mtime_ns, blake2b hash)
+        self.folder_mtimes = folder_mtimes or {}  # relative folder ("" for the root) -> mtime_ns when it was listed
+        self.checked = time.monotonic()
+        digest = hashlib.blake2b(digest_size=16)
+        for relative_path in sorted(files):
+            digest.update(f"{relative_path}\0{files[relative_path][2]}\0".encode("utf-8"))
+        self.digest = digest.hexdigest()  # Changes whenever a file of the template is added, removed or edited.
+        self.total_bytes = sum(size for size, _, _ in files.values())
+
+    def folders_unchanged(self):
+        # Adding, removing or renaming a file bumps its folder's mtime, so this is one stat per folder, not per file.
+        try:
+            return all(os.stat(os.path.join(self.root, relative_dir)).st_mtime_ns == mtime_ns
+                       for relative_dir, mtime_ns in self.folder_mtimes.items())
+        except FileNotFoundError:
+            return False
+
+
+class TemplateCache:
+    """
+    Pre-indexed department templates, cloned into new workspaces without walking the template each time.
+
+    A template is indexed once (folders, file sizes and content hashes) and re-checked every check_interval
+    seconds, or sooner when one of its folders changed, only re-hashing the files whose size or mtime changed.
+
+    clone() pre-creates the folder tree in one pass, then reflinks every file where the filesystem allows
+    (btrfs, XFS), hardlinks the files matching immutable_patterns otherwise, and plain copies the rest.
+    Hardlinked files share their data with the template, so only list files nobody edits in place.
+    """
+
+    def __init__(self, check_interval=30.0, immutable_patterns=(), workers=8):
+        self.check_interval = check_interval
+        self.immutable_patterns = [pattern for pattern in immutable_patterns if pattern]
+        self.workers = workers
+        self._indexes = {}  # normalised template root -> TemplateIndex
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, root):
+        with self._locks_lock:
+            lock = self._locks.get(root)
+            if lock is None:
+                lock = self._locks[root] = threading.Lock()
+            return lock
+
+    def get(self, root):
+        """
+        Returns the index of a template folder, (re)indexing it when it is new, due a check or a folder changed.
+
+        Returns:
+            TemplateIndex: The template's folders, files and digest.
+        """
+        root = os.path.normpath(root)
+        with self._lock_for(root):
+            index = self._indexes.get(root)
+            if (index is None or time.monotonic() - index.checked >= self.check_interval
+                    or not index.folders_unchanged()):
+                index = self._indexes[root] = self._index(root, index)
+            return index
+
+    def preload(self, templates_root):
+        # Index every department template under templates_root, so the first workspace is fast too.
+        if not os.path.isdir(templates_root):
+            return []
+        with os.scandir(templates_root) as entries:
+            roots = [entry.path for entry in entries if entry.is_dir()]
+        for root in roots:
+            self.get(root)
+        return roots
+
+    def forget(self, root=None):
+        if root is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(os.path.normpath(root), None)
+
+    def _index(self, root, previous=None):
+        directories = []
+        stats = {}
+        folder_mtimes = {}
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            folder = os.path.join(root, relative_dir)
+            # Taken before listing, a file added meanwhile makes the next get() re-index.
+            folder_mtimes[relative_dir] = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name)
+                    if entry.is_dir():
+                        directories.append(relative_path)
+                        pending.append(relative_path)
+                    else:
+                        stat = entry.stat()
+                        stats[relative_path] = (stat.st_size, stat.st_mtime_ns)
+        directories.sort()
+
+        # Only hash new or changed files.
+        known = previous.files if previous is not None else {}
+        files = {}
+        to_hash = []
+        for relative_path, (size, mtime_ns) in stats.items():
+            old = known.get(relative_path)
+            if old is not None and old[:2] == (size, mtime_ns):
+                files[relative_path] = old
+            else:
+                to_hash.append(relative_path)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="template-hash") as executor:
+            hashes = executor.map(lambda path: hash_file(os.path.join(root, path)), to_hash)
+            for relative_path, file_hash in zip(to_hash, hashes):
+                files[relative_path] = (*stats[relative_path], file_hash)
+        return TemplateIndex(root, directories, files, folder_mtimes)
+
+    def is_immutable(self, relative_path):
+        name = os.path.basename(relative_path)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.immutable_patterns)
+
+    def clone(self, root, destination, mode="clone"):
+        """
+        Creates destination as a copy of the template folder root. destination must not exist yet.
+
+        Args:
+            root (str): The template folder.
+            destination (str): The folder to create.
+            mode (str): "clone" for the indexed reflink/hardlink/copy clone, "copy" for a plain shutil.copytree.
+
+        Returns:
+            dict: The mode, template digest, file and byte counts per strategy and the timing of each phase.
+        """
+        if mode not in CLONE_MODES:
+            raise ValueError(f"Unknown template clone mode: {mode}")
+        started = time.perf_counter()
+        if mode == "copy":
+            shutil.copytree(root, destination)
+            return {"mode": mode, "seconds": round(time.perf_counter() - started, 4)}
+
+        index = self.get(root)
+        try:
+            return self._clone(root, destination, mode, index, started)
+        except FileNotFoundError:
+            # A template file vanished since the index was taken, start over from a fresh index.
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            self.forget(root)
+            return self._clone(root, destination, mode, self.get(root), started)
+
+    def _clone(self, root, destination, mode, index, started):
+        indexed = time.perf_counter()
+
+        # The whole tree in one pass, before any file is written.
+        os.makedirs(destination)
+        for relative_dir in index.directories:
+            os.mkdir(os.path.join(destination, relative_dir))
+        created = time.perf_counter()
+
+        strategies = {"reflink": [0, 0], "hardlink": [0, 0], "copy": [0, 0]}  # strategy -> [files, bytes]
+        strategies_lock = threading.Lock()
+        can_reflink = [fcntl is not None]  # Switched off after the first refusal, the whole tree is on one filesystem.
+
+        def clone_one(item):
+            relative_path, (size, _, _) = item
+            source_path = os.path.join(root, relative_path)
+            destination_path = os.path.join(destination, relative_path)
+            if can_reflink[0] and reflink_file(source_path, destination_path):
+                strategy = "reflink"
+            else:
+                can_reflink[0] = False
+                if self.is_immutable(relative_path) and hardlink_file(source_path, destination_path):
+                    strategy = "hardlink"
+                else:
+                    copy_file(source_path, destination_path)
+                    strategy = "copy"
+            with strategies_lock:
+                strategies[strategy][0] += 1
+                strategies[strategy][1] += size
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="template-clone") as executor:
+            for _ in executor.map(clone_one, index.files.items()):
+                pass
+        finished = time.perf_counter()
+
+        return {
+            "mode": mode,
+            "template_digest": index.digest,
+            "directories": len(index.directories),
+            "files": {strategy: counts[0] for strategy, counts in strategies.items()},
+            "bytes": {strategy: counts[1] for strategy, counts in strategies.items()},
+            "index_seconds": round(indexed - started, 4),
+            "directories_seconds": round(created - indexed, 4),
+            "files_seconds": round(finished - created, 4),
+            "seconds": round(finished - started, 4),
+        }
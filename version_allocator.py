@@ -0,0 +1,90 @@
+import os
+import re
+import threading
+
+# vXXXX folders, at least 4 digits as created by format_version().
+VERSION_PATTERN = re.compile(r"^v(\d{4,})$")
+
+
+def format_version(number):
+    return f"v{str(number).zfill(4)}"
+
+
+def highest_version(parent):
+    """
+    Scans a folder for vXXXX sub folders.
+
+    Returns:
+        int: The highest version number found, 0 if there are none or the folder doesn't exist.
+    """
+    highest = 0
+    try:
+        with os.scandir(parent) as entries:
+            for entry in entries:
+                match = VERSION_PATTERN.match(entry.name)
+                if match and entry.is_dir():
+                    highest = max(highest, int(match.group(1)))
+    except FileNotFoundError:
+        pass
+    return highest
+
+
+class VersionAllocator:
+    """
+    Hands out the next vXXXX folder of a path, safe against concurrent requests.
+
+    A version is claimed by creating its folder with os.mkdir, which is atomic on local disks
+    and SMB/NFS shares, so two requests (or two servers) can never get the same folder; the
+    loser of a race just moves on to the next number. The highest version is cached per path
+    together with the folder's mtime, so the folder is only rescanned when something else has
+    changed it.
+    """
+
+    def __init__(self):
+        self._known = {}  # parent path -> (highest version, parent mtime_ns when it was recorded)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, parent):
+        with self._locks_lock:
+            lock = self._locks.get(parent)
+            if lock is None:
+                lock = self._locks[parent] = threading.Lock()
+            return lock
+
+    def claim(self, parent):
+        """
+        Creates the next version folder inside parent, creating parent if needed.
+
+        Returns:
+            tuple: (version string e.g. "v0003", full path of the new version folder)
+        """
+        parent = os.path.normpath(parent)
+        with self._lock_for(parent):
+            os.makedirs(parent, exist_ok=True)
+            number = self._highest(parent) + 1
+            while True:
+                path = os.path.join(parent, format_version(number))
+                try:
+                    os.mkdir(path)
+                    break
+                except FileExistsError:
+                    number += 1  # Claimed by another process since the listing.
+            self._known[parent] = (number, os.stat(parent).st_mtime_ns)
+        return format_version(number), path
+
+    def _highest(self, parent):
+        known = self._known.get(parent)
+        if known is not None and known[1] == os.stat(parent).st_mtime_ns:
+            return known[0]
+        return highest_version(parent)
+
+    def forget(self, parent=None):
+        # Drop the cached versions of one path, or all of them.
+        if parent is None:
+            self._known.clear()
+        else:
+            self._known.pop(os.path.normpath(parent), None)
+
+
+version_allocator = VersionAllocator()
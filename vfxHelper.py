@@ -1,28 +1,400 @@
 import os
+import re
 import json
+import time
+import uuid
+import asyncio
+import hashlib
 import logging
-from typing import List, Union, Generator, Iterator, final
+import sqlite3
+import ntpath
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import PurePosixPath, PureWindowsPath
+from typing import List, Union, Generator, Iterator, AsyncIterator, final
 
 from pydantic import BaseModel
 import ollama
-import requests
 import httpx
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Prompt templates served by the FastAPI host, fetched once and cached on the Pipeline.
+PROMPT_NAMES = ("relevance_prompt", "user_intent_prompt", "setup_prompt", "ingestion_prompt",
+                "extract_ingestion_prompt", "route_prompt")
+# ROUTING_MODE values, "combined" asks for relevance and intent in one LLM call.
+ROUTING_MODES = ("two_step", "combined")
+USER_INTENTS = ("ingestion", "setup", "unsure")
+# Header carrying a turn's correlation id to the FastAPI host, which tags its own logs and replies with it.
+CORRELATION_HEADER = "X-Correlation-ID"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text exposition format.
+# Seconds, from a cached prompt up to a long ingest.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# Job ids in polled URLs, replaced so each job isn't its own metric series.
+JOB_ID_PATTERN = re.compile(r"/[0-9a-f]{32}(?=/|$)")
+
+# Correlation id and stage timings of the turn being handled, inherited by every task the turn starts.
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+turn_spans = contextvars.ContextVar("turn_spans", default=None)
+
+
+def summarise_spans(spans):
+    # "route=812.0ms llm=3x1520.4ms ..." in the order the stages first ran, repeated stages are summed.
+    totals = {}
+    for stage, seconds in spans:
+        count, total = totals.get(stage, (0, 0.0))
+        totals[stage] = (count + 1, total + seconds)
+    return " ".join(f"{stage}={str(count) + 'x' if count > 1 else ''}{total * 1000:.1f}ms"
+                    for stage, (count, total) in totals.items())
+
+
+class PromptCache:
+    """
+    Keeps the prompt templates in memory for ttl seconds.
+
+    Once an entry is stale it is revalidated against the server with its ETag,
+    so an unchanged prompt only costs a 304 instead of the full text.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}  # name -> {"content": str, "etag": str, "fetched": float}
+
+    def get(self, name):
+        # Returns the cached content if it is still fresh, otherwise None.
+        entry = self._entries.get(name)
+        if entry and time.monotonic() - entry["fetched"] < self.ttl:
+            return entry["content"]
+        return None
+
+    def get_stale(self, name):
+        entry = self._entries.get(name)
+        return entry["content"] if entry else None
+
+    def etag(self, name):
+        entry = self._entries.get(name)
+        return entry["etag"] if entry else None
+
+    def store(self, name, content, etag):
+        self._entries[name] = {"content": content, "etag": etag, "fetched": time.monotonic()}
+
+    def touch(self, name):
+        # The server confirmed the cached version is still current.
+        self._entries[name]["fetched"] = time.monotonic()
+
+    def clear(self):
+        self._entries.clear()
+
+
+class LLMResponseCache:
+    """
+    Bounded LRU cache of LLM replies keyed on model + normalised prompt.
+
+    Only meant for the deterministic classification and extraction calls, never for
+    free-form replies. Entries expire after ttl seconds and can optionally be persisted
+    to a local SQLite file so they survive a restart.
+    """
+
+    def __init__(self, max_size, ttl, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (reply, stored time)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open_db(path)
+
+    @staticmethod
+    def make_key(model, prompt):
+        normalised_prompt = " ".join(prompt.split())
+        return hashlib.sha256(f"{model}\0{normalised_prompt}".encode("utf-8")).hexdigest()
+
+    def _open_db(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, reply TEXT, stored REAL)")
+        self._db.execute("DELETE FROM llm_cache WHERE stored < ?", (time.time() - self.ttl,))
+        self._db.commit()
+        rows = self._db.execute("SELECT key, reply, stored FROM llm_cache ORDER BY stored DESC LIMIT ?",
+                                (self.max_size,)).fetchall()
+        for key, reply, stored in reversed(rows):
+            self._entries[key] = (reply, stored)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            return None
+
+    def put(self, key, reply):
+        # Returns the number of entries evicted to make room.
+        if self.max_size <= 0:
+            return 0
+        stored = time.time()
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (reply, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted_key, _ = self._entries.popitem(last=False)
+                evicted += 1
+                if self._db is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (evicted_key,))
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO llm_cache (key, reply, stored) VALUES (?, ?, ?)",
+                                 (key, reply, stored))
+                self._db.commit()
+        return evicted
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class PreRouter:
+    """
+    Keyword and regex router that mirrors the rules in relevance_prompt.txt, user_intent.txt and
+    ingestion_prompt.txt, so obvious messages can skip the LLM.
+
+    classify() returns None whenever the rules are not confident and the LLM should decide.
+    """
+
+    INGEST_PATTERN = re.compile(r"\b(ingest\w*|digest\w*)\b", re.IGNORECASE)
+    SETUP_PATTERN = re.compile(r"\b(set\s?up\w*)\b", re.IGNORECASE)
+    PROJECT_PATTERN = re.compile(r"\b([A-Z][A-Z0-9]*_[A-Z0-9_]+)\b")
+    SEQUENCE_PATTERN = re.compile(r"\b(seq(?:uence)?_?\d+)\b", re.IGNORECASE)
+    SHOT_PATTERN = re.compile(r"\b(shot_?\d+|sh_?\d+)\b", re.IGNORECASE)
+    USER_PATTERN = re.compile(r"\bfor\s+([A-Z][a-z]+)\b")
+    DEPARTMENT_PATTERN = re.compile(r"\b(fx|anim|animation|lighting|comp|rig|mm|matchmove|layout|model|lookdev|"
+                                    r"roto|paint)\b", re.IGNORECASE)
+    # Rule 1-4 of ingestion_prompt.txt, the ingestion folder keyword and the words that select it.
+    INGESTION_FOLDER_PATTERNS = (
+        ("plate", re.compile(r"\b(plates?|bg)\b", re.IGNORECASE)),
+        ("fx", re.compile(r"\b(fx|houdini)\b", re.IGNORECASE)),
+        ("rig", re.compile(r"\b(rigs?|characters?)\b", re.IGNORECASE)),
+        ("mm", re.compile(r"\b(matchmove|mm|cameras?)\b", re.IGNORECASE)),
+    )
+    # "...but not the camera", "everything except the rig": the folders asked for aren't just the ones named.
+    NEGATION_PATTERN = re.compile(r"\b(not|except|without|but|excluding)\b|n't\b", re.IGNORECASE)
+    # Anything in this list means the message could be for the pipeline, so it is never routed away locally.
+    PIPELINE_VOCABULARY = re.compile(r"\b(pipeline|workspace|template|version|department|project|shots?|"
+                                     r"seq\w*|ingest\w*|digest\w*|set\s?up\w*|files?|folders?|copy|deliver\w*|"
+                                     r"plates?|bg|rigs?|characters?|fx|houdini|mm|matchmove|cameras?|exr)\b",
+                                     re.IGNORECASE)
+
+    def __init__(self):
+        self.counters = {"messages": 0, "hits": 0, "misses": 0, "not_relevant": 0, "setup": 0, "ingestion": 0,
+                         "fields_extracted": 0}
+
+    def classify(self, message):
+        # Returns {"relevant": bool, "intent": str or None, "fields": dict or None} or None if unsure.
+        self.counters["messages"] += 1
+        decision = self._classify(message)
+        if decision is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self.counters[decision["intent"] or "not_relevant"] += 1
+        if decision["fields"]:
+            self.counters["fields_extracted"] += 1
+        return decision
+
+    def _classify(self, message):
+        wants_ingest = bool(self.INGEST_PATTERN.search(message))
+        wants_setup = bool(self.SETUP_PATTERN.search(message))
+        # "set up" and "ingest"/"digest" are common words, they only count next to a sequence or shot name
+        # (or when every field was extracted), a setup routed here creates real folders on the project root.
+        if wants_ingest and not wants_setup:
+            fields = self.ingestion_fields(message)
+            if fields or self.has_shot_reference(message):
+                return {"relevant": True, "intent": "ingestion", "fields": fields}
+            return None
+        if wants_setup and not wants_ingest:
+            fields = self.setup_fields(message)
+            if fields or self.has_shot_reference(message):
+                return {"relevant": True, "intent": "setup", "fields": fields}
+            return None
+        if not wants_ingest and not wants_setup and not self.PIPELINE_VOCABULARY.search(message) \
+                and not self.PROJECT_PATTERN.search(message):
+            return {"relevant": False, "intent": None, "fields": None}
+        return None
+
+    def has_shot_reference(self, message):
+        return bool(self.SEQUENCE_PATTERN.search(message) or self.SHOT_PATTERN.search(message))
+
+    def setup_fields(self, message):
+        # Same keys and order as setup_prompt.txt, only returned when every key was found exactly once.
+        projects = set(self.PROJECT_PATTERN.findall(message))
+        sequences = set(self.SEQUENCE_PATTERN.findall(message))
+        shots = set(self.SHOT_PATTERN.findall(message))
+        departments = {department.lower() for department in self.DEPARTMENT_PATTERN.findall(message)}
+        users = set(self.USER_PATTERN.findall(message))
+        if not all(len(found) == 1 for found in (projects, sequences, shots, departments, users)):
+            return None
+        return {"project": projects.pop(),
+                "sequence": sequences.pop(),
+                "shot": shots.pop(),
+                "department": departments.pop(),
+                "user": users.pop()}
+
+    def ingestion_fields(self, message):
+        # Same structure as ingestion_prompt.txt, one request per shot, or None if anything is ambiguous.
+        # Several shots with several folders ("plates for Shot1 and the rig for Shot2") can't be paired up
+        # without the LLM, and neither can a negation.
+        if self.NEGATION_PATTERN.search(message):
+            return None
+        projects = set(self.PROJECT_PATTERN.findall(message))
+        sequences = set(self.SEQUENCE_PATTERN.findall(message))
+        shots = list(dict.fromkeys(self.SHOT_PATTERN.findall(message)))
+        folders = [folder for folder, pattern in self.INGESTION_FOLDER_PATTERNS if pattern.search(message)]
+        if len(projects) != 1 or len(sequences) != 1 or not shots or not folders:
+            return None
+        if len(shots) > 1 and len(folders) > 1:
+            return None
+        project, sequence = projects.pop(), sequences.pop()
+        return {f"request{index}": {"project": project,
+                                    "sequence": sequence,
+                                    "shot": shot,
+                                    "ingestion": folders}
+                for index, shot in enumerate(shots, start=1)}
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["hit_rate"] = self.counters["hits"] / self.counters["messages"] if self.counters["messages"] else 0.0
+        return stats
+
+
+class PipelineMetrics:
+    """
+    Counters and latency histograms of the Pipeline, rendered in the Prometheus text format for /metrics.
+
+    Metrics are created on first use. The FastAPI host has its own in telemetry.py, a Pipeline has to be one file.
+    """
+
+    DESCRIPTIONS = {
+        "vfx_pipeline_turn_seconds": ("histogram", "Time from a chat message to the start of its reply."),
+        "vfx_pipeline_stage_seconds": ("histogram", "Time spent in each stage of a turn."),
+        "vfx_pipeline_http_request_seconds": ("histogram", "Time to the response headers of requests to the servers."),
+        "vfx_pipeline_llm_requests_total": ("counter", "Requests sent to Ollama."),
+        "vfx_pipeline_llm_tokens_total": ("counter", "Prompt and completion tokens reported by Ollama."),
+        "vfx_pipeline_cache_lookups_total": ("counter", "Prompt, LLM reply and pre-router lookups by result."),
+        "vfx_pipeline_cache_evictions_total": ("counter", "LLM replies dropped from the full reply cache."),
+        "vfx_pipeline_files_ingested_total": ("counter", "Files the FastAPI host copied or linked for ingests."),
+        "vfx_pipeline_bytes_ingested_total": ("counter", "Bytes the FastAPI host copied for ingests."),
+    }
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counters = {}  # (name, ((label, value), ...)) -> value
+        self._histograms = {}  # (name, ((label, value), ...)) -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = [(label, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+                 for label, value in (*labels, *extra)]
+        return "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}" if pairs else ""
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(series[0]), series[1], series[2]) for key, series in self._histograms.items()}
+        families = {}  # name -> sample lines
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms.items():
+            lines = families.setdefault(name, [])
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', repr(float(bound))),))} {bucket_count}")
+            lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total!r}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        output = []
+        for name in sorted(families):
+            kind, documentation = self.DESCRIPTIONS.get(name, ("untyped", name))
+            output.extend((f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", *families[name]))
+        return "\n".join(output) + "\n"
+
 
 class Pipeline:
     class Valves(BaseModel):
         FLASK_HOST: str
         OLLAMA_HOST: str
         OLLAMA_MODEL: str
+        PROMPT_CACHE_TTL: float
+        HTTP_CONNECT_TIMEOUT: float
+        HTTP_READ_TIMEOUT: float
+        HTTP_RETRIES: int
+        HTTP_POOL_SIZE: int
+        HEALTH_CHECK_INTERVAL: float
+        HEALTH_CHECK_MAX_INTERVAL: float
+        INGESTION_CONCURRENCY: int
+        ROUTING_MODE: str
+        PRE_ROUTER: bool
+        LLM_CACHE_SIZE: int
+        LLM_CACHE_TTL: float
+        LLM_CACHE_PATH: str
+        STREAM_RESPONSES: bool
+        USE_JOB_QUEUE: bool
+        JOB_POLL_INTERVAL: float
+        JOB_TIMEOUT: float
+        INGEST_BATCH: bool
+        INGEST_ROOT: str
+        API_VERSION: str
+        METRICS_PORT: int
+        METRICS_HOST: str
         EXTRA: str
 
     def __init__(self):
         self.name = "VFX Pipeline Helper DEV"
         self.flask_status = None
+        self.flask_status_time = None
         self.ollama_client = None
+        self._ollama_client_host = None
         self.ollama_status = None
+        self.ollama_status_time = None
+        self.http_client = None
+        self.health_monitor = None
+        # Event loop the async clients live on. on_startup uses the server's loop, a standalone pipe() call
+        # starts a private one in a background thread.
+        self.loop = None
+        self._loop_lock = threading.Lock()
+        self._client_loops = {}  # client attribute name -> loop it was created on
 
         self.valves = self.Valves(
             **{
@@ -30,65 +402,362 @@ class Pipeline:
                 "FLASK_HOST": os.getenv("FLASK_HOST", "http://localhost:5000"),
                 "OLLAMA_HOST": os.getenv("OLLAMA_HOST", "http://localhost:11434"),
                 "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "llama3.2"),
+                "PROMPT_CACHE_TTL": os.getenv("PROMPT_CACHE_TTL", "300"),  # Seconds before a prompt is revalidated.
+                "HTTP_CONNECT_TIMEOUT": os.getenv("HTTP_CONNECT_TIMEOUT", "5"),
+                "HTTP_READ_TIMEOUT": os.getenv("HTTP_READ_TIMEOUT", "600"),  # Ingests can hold the request for minutes.
+                "HTTP_RETRIES": os.getenv("HTTP_RETRIES", "2"),  # Retries on connection failures only.
+                "HTTP_POOL_SIZE": os.getenv("HTTP_POOL_SIZE", "10"),
+                "HEALTH_CHECK_INTERVAL": os.getenv("HEALTH_CHECK_INTERVAL", "15"),  # Seconds between health checks.
+                "HEALTH_CHECK_MAX_INTERVAL": os.getenv("HEALTH_CHECK_MAX_INTERVAL", "120"),  # Backoff cap while down.
+                "INGESTION_CONCURRENCY": os.getenv("INGESTION_CONCURRENCY", "4"),  # Folder chains run at once, 1 = sequential.
+                "ROUTING_MODE": os.getenv("ROUTING_MODE", "two_step"),  # One of ROUTING_MODES.
+                "PRE_ROUTER": os.getenv("PRE_ROUTER", "false"),  # Route obvious messages without the LLM.
+                "LLM_CACHE_SIZE": os.getenv("LLM_CACHE_SIZE", "512"),  # Cached classification replies, 0 disables.
+                "LLM_CACHE_TTL": os.getenv("LLM_CACHE_TTL", "3600"),
+                "LLM_CACHE_PATH": os.getenv("LLM_CACHE_PATH", ""),  # SQLite file to persist the cache, "" = memory.
+                "STREAM_RESPONSES": os.getenv("STREAM_RESPONSES", "true"),  # Stream replies when the UI asks for it.
+                "USE_JOB_QUEUE": os.getenv("USE_JOB_QUEUE", "false"),  # Run setups/ingests as server jobs and poll.
+                "JOB_POLL_INTERVAL": os.getenv("JOB_POLL_INTERVAL", "2"),
+                "JOB_TIMEOUT": os.getenv("JOB_TIMEOUT", "3600"),  # Seconds to wait for a job before giving up.
+                "INGEST_BATCH": os.getenv("INGEST_BATCH", "true"),  # Send all of a message's ingests in one request.
+                # Root the ingest folders are searched under, written as the server's "temp" storage root on any
+                # platform it knows (the server maps it to its own mount point).
+                "INGEST_ROOT": os.getenv("INGEST_ROOT", "T:\\"),
+                # "v2" talks native JSON to the /v2 endpoints, "v1" keeps the original double-encoded endpoints.
+                "API_VERSION": os.getenv("API_VERSION", "v2"),
+                "METRICS_PORT": os.getenv("METRICS_PORT", "9464"),  # Prometheus /metrics port, 0 disables it.
+                # Local only by default, e.g. "0.0.0.0" lets a Prometheus on another host scrape it.
+                "METRICS_HOST": os.getenv("METRICS_HOST", "127.0.0.1"),
                 "EXTRA": os.getenv("EXTRA", "")
             }
         )
+        self.prompt_cache = PromptCache(ttl=self.valves.PROMPT_CACHE_TTL)
+        self.pre_router = PreRouter()
+        self.llm_cache = LLMResponseCache(max_size=self.valves.LLM_CACHE_SIZE, ttl=self.valves.LLM_CACHE_TTL,
+                                          path=self.valves.LLM_CACHE_PATH or None)
+        self._llm_inflight = {}  # cache key -> future of an identical call that is already running
+        self.metrics = PipelineMetrics()
+        self.metrics_server = None
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
-        self.heartbeat()
+        self.loop = asyncio.get_running_loop()
+        self.start_metrics_server()
+        self.open_http_client()
+        await self.heartbeat()
+        await self.warm_prompt_cache()
+        self.health_monitor = asyncio.create_task(self.run_health_monitor())
 
     async def on_shutdown(self):
         # This function is called when the server is shutdown.
         logging.info(f"on_shutdown:{__name__}")
-        pass
+        if self.health_monitor is not None:
+            self.health_monitor.cancel()
+            self.health_monitor = None
+        await self.close_http_client()
+        self.llm_cache.close()
+        if self.metrics_server is not None:
+            await asyncio.to_thread(self.metrics_server.shutdown)
+            self.metrics_server.server_close()
+            self.metrics_server = None
+
+    def start_metrics_server(self):
+        # Serve the Prometheus /metrics page on METRICS_HOST:METRICS_PORT from a daemon thread.
+        port = self.valves.METRICS_PORT
+        if port <= 0 or self.metrics_server is not None:
+            return
+        metrics = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                page = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, format, *args):
+                pass  # One line per scrape would drown the pipeline's own logs.
 
-    def heartbeat(self):
-        #  Check if Flask Server is Running
         try:
-            url = f'{self.valves.FLASK_HOST}/ping'
+            self.metrics_server = ThreadingHTTPServer((self.valves.METRICS_HOST, port), MetricsHandler)
+        except OSError as e:
+            logging.error(f"Could not serve metrics on {self.valves.METRICS_HOST}:{port}: {e}")
+            return
+        threading.Thread(target=self.metrics_server.serve_forever, name="vfx-metrics", daemon=True).start()
+
+    @contextmanager
+    def span(self, stage):
+        # Time a stage into vfx_pipeline_stage_seconds and the trace of the current turn.
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.metrics.observe("vfx_pipeline_stage_seconds", seconds, stage=stage)
+            spans = turn_spans.get()
+            if spans is not None:
+                spans.append((stage, seconds))
 
-            response = requests.get(url)
+    async def on_http_request(self, request):
+        # httpx hook: tag every request with the turn's correlation id and note when it was sent.
+        request_id = correlation_id.get()
+        if request_id:
+            request.headers[CORRELATION_HEADER] = request_id
+        request.extensions["vfx_started"] = time.perf_counter()
 
+    async def on_http_response(self, response):
+        # httpx hook: record the request's latency and add the stages the server reported to the turn's trace.
+        request = response.request
+        started = request.extensions.get("vfx_started")
+        if started is not None:
+            self.metrics.observe("vfx_pipeline_http_request_seconds", time.perf_counter() - started,
+                                 endpoint=JOB_ID_PATTERN.sub("/{job_id}", request.url.path),
+                                 status=response.status_code)
+        spans = turn_spans.get()
+        if spans is not None:
+            for timing in response.headers.get("Server-Timing", "").split(","):
+                stage, _, milliseconds = timing.strip().partition(";dur=")
+                if stage and milliseconds:
+                    spans.append((f"server.{stage}", float(milliseconds) / 1000))
+
+    def run_coroutine(self, coroutine):
+        # Run a coroutine on the pipeline's event loop from a worker thread and block until it is done.
+        loop = self.loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            loop = self.start_background_loop()
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            coroutine.close()
+            raise RuntimeError("pipe() cannot block the Pipeline's own event loop, await apipe() instead.")
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    def iterate_async(self, async_iterator):
+        # Sync generator over an async generator that runs on the pipeline's event loop.
+        async def next_item():
+            return await async_iterator.__anext__()
+
+        async def close():
+            await async_iterator.aclose()
+
+        try:
+            while True:
+                try:
+                    yield self.run_coroutine(next_item())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run_coroutine(close())
+
+    def start_background_loop(self):
+        with self._loop_lock:
+            if self.loop is not None and self.loop.is_running():
+                return self.loop
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="vfx-pipeline-loop", daemon=True).start()
+            self.loop = loop
+            return loop
+
+    def _client_is_current(self, name):
+        # Async clients are bound to the loop they were created on.
+        client = getattr(self, name)
+        return client is not None and self._client_loops.get(name) is asyncio.get_running_loop()
+
+    def open_http_client(self):
+        # One pooled keep-alive client for all traffic to the FastAPI host.
+        timeout = httpx.Timeout(self.valves.HTTP_READ_TIMEOUT, connect=self.valves.HTTP_CONNECT_TIMEOUT)
+        limits = httpx.Limits(max_connections=self.valves.HTTP_POOL_SIZE,
+                              max_keepalive_connections=self.valves.HTTP_POOL_SIZE)
+        transport = httpx.AsyncHTTPTransport(retries=self.valves.HTTP_RETRIES, limits=limits)
+        event_hooks = {"request": [self.on_http_request], "response": [self.on_http_response]}
+        self.http_client = httpx.AsyncClient(timeout=timeout, transport=transport, event_hooks=event_hooks)
+        self._client_loops["http_client"] = asyncio.get_running_loop()
+        return self.http_client
+
+    async def close_http_client(self):
+        if self.http_client is not None:
+            if self._client_is_current("http_client"):
+                await self.http_client.aclose()
+            self.http_client = None
+
+    def get_http_client(self):
+        # apipe() can be called without on_startup (e.g. from a script), so create the client lazily.
+        if not self._client_is_current("http_client") or self.http_client.is_closed:
+            return self.open_http_client()
+        return self.http_client
+
+    def get_ollama_client(self):
+        # Reuse the Ollama client, only rebuilding it when the host valve or the event loop changes.
+        host = str(self.valves.OLLAMA_HOST)
+        if not self._client_is_current("ollama_client") or self._ollama_client_host != host:
+            self.ollama_client = ollama.AsyncClient(host=host)
+            self._ollama_client_host = host
+            self._client_loops["ollama_client"] = asyncio.get_running_loop()
+        return self.ollama_client
+
+    async def check_flask(self):
+        #  Check if Flask Server is Running
+        try:
+            url = f'{self.valves.FLASK_HOST}/ping'
+            response = await self.get_http_client().get(url, timeout=self.valves.HTTP_CONNECT_TIMEOUT)
             if response.status_code == 200:
-                logging.info("Server is responding correctly:", response.json())
-                self.flask_status = True
-            else:
-                logging.error("Failed to ping server:", response.text, "Status code:", response.status_code)
-                self.flask_status = False
+                return True
+            logging.error(f"Failed to ping server: {response.text} Status code: {response.status_code}")
         except Exception as e:
-            logging.error("An error occurred while testing the Flask server:", str(e))
-            self.flask_status = False
-        logging.info(f"Flask Status: {self.flask_status}")
+            logging.error(f"An error occurred while testing the Flask server: {str(e)}")
+        return False
 
-        # Check if Ollama is running.
-        self.ollama_client = ollama.Client(host=str(self.valves.OLLAMA_HOST))
+    async def check_ollama(self):
+        # /api/version is a constant-time reply, unlike listing every installed model.
         try:
-            self.ollama_client.list()
-            self.ollama_status = True
-        except (httpx.ConnectError, ConnectionResetError) as e:
+            url = f'{self.valves.OLLAMA_HOST}/api/version'
+            response = await self.get_http_client().get(url, timeout=self.valves.HTTP_CONNECT_TIMEOUT)
+            if response.status_code == 200:
+                return True
+            logging.error(f"Failed to reach Ollama: {response.text} Status code: {response.status_code}")
+        except (httpx.HTTPError, ConnectionResetError) as e:
             logging.error(f"Connection error: {e}")
-            self.ollama_status = False
-        logging.info(f"Ollama Status: {self.ollama_status}")
+        return False
+
+    async def heartbeat(self):
+        # Refresh the cached status of both servers, only logging when a status changes.
+        flask_status, ollama_status = await asyncio.gather(self.check_flask(), self.check_ollama())
+        if flask_status != self.flask_status:
+            logging.info(f"Flask Status: {flask_status}")
+        self.flask_status = flask_status
+        self.flask_status_time = time.time()
+
+        if ollama_status != self.ollama_status:
+            logging.info(f"Ollama Status: {ollama_status}")
+        self.ollama_status = ollama_status
+        self.ollama_status_time = time.time()
 
-    def connect_ollama(self, message, **kwargs):
+    async def run_health_monitor(self):
+        # Poll both servers in the background, backing off while either of them is down.
+        interval = self.valves.HEALTH_CHECK_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logging.error(f"Health check failed: {e}")
+            if self.flask_status and self.ollama_status:
+                interval = self.valves.HEALTH_CHECK_INTERVAL
+            else:
+                interval = min(interval * 2, self.valves.HEALTH_CHECK_MAX_INTERVAL)
+
+    async def servers_ready(self):
+        # Uses the cached status from the health monitor. Only checks again if there is no monitor running
+        # or a server was last seen down, so a recovered server is picked up without waiting for the backoff.
+        if self.health_monitor is None or self.health_monitor.done() or not (self.flask_status and self.ollama_status):
+            await self.heartbeat()
+        return self.flask_status and self.ollama_status
+
+    async def connect_ollama(self, message, cache=False, **kwargs):
         # This Function communicates with remote Ollama Host via message.
+        # cache=True is only for deterministic classification/extraction prompts, never for free-form replies.
+        ollama_model = self.valves.OLLAMA_MODEL
+        if kwargs.get("model"):
+            ollama_model = kwargs.get("model")
+
+        if not cache or self.valves.LLM_CACHE_SIZE <= 0:
+            return await self._chat(ollama_model, message)
+
+        key = LLMResponseCache.make_key(ollama_model, message)
+        message_reply = self.llm_cache.get(key)
+        if message_reply is not None:
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="llm", result="hit")
+            return message_reply
+        # Identical calls in flight at the same time (e.g. parallel ingestion folders) share one request.
+        inflight = self._llm_inflight.get(key)
+        if inflight is not None:
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="llm", result="coalesced")
+            return await asyncio.shield(inflight)
+        self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="llm", result="miss")
+        inflight = asyncio.get_running_loop().create_future()
+        self._llm_inflight[key] = inflight
+        try:
+            message_reply = await self._chat(ollama_model, message)
+            evicted = self.llm_cache.put(key, message_reply)
+            if evicted:
+                self.metrics.inc("vfx_pipeline_cache_evictions_total", evicted, cache="llm")
+            inflight.set_result(message_reply)
+            return message_reply
+        except asyncio.CancelledError:
+            inflight.cancel()
+            raise
+        except Exception as e:
+            inflight.set_exception(e)
+            inflight.exception()  # Mark as retrieved when nobody else was waiting.
+            raise
+        finally:
+            del self._llm_inflight[key]
+
+    async def stream_ollama(self, message, **kwargs):
+        # Yields the reply text as Ollama produces it.
         ollama_model = self.valves.OLLAMA_MODEL
         if kwargs.get("model"):
             ollama_model = kwargs.get("model")
 
-        ollama_result = self.ollama_client.chat(model=ollama_model, messages=[
-                    {
-                        'role': 'user',
-                        'content': message,
-                    },
-                ])
+        with self.span("llm_stream"):
+            stream = await self.get_ollama_client().chat(model=ollama_model, stream=True, messages=[
+                        {
+                            'role': 'user',
+                            'content': message,
+                        },
+                    ])
+            async for part in stream:
+                content = part.get("message").get("content")
+                if content:
+                    yield content
+                if part.get("done"):
+                    self.record_llm_usage(ollama_model, "stream", part)
+
+    async def llm_reply(self, message, stream=False):
+        # Free-form reply for the user, streamed when the UI asked for it.
+        if stream:
+            return self.stream_ollama(message)
+        return await self.connect_ollama(message)
+
+    async def connect_ollama_json(self, message, **kwargs):
+        # Cached LLM call that expects a JSON reply. A reply that doesn't parse is dropped from the cache.
+        message_reply = await self.connect_ollama(message, cache=True, **kwargs)
+        try:
+            return json.loads(message_reply)
+        except ValueError:
+            self.llm_cache.discard(LLMResponseCache.make_key(kwargs.get("model") or self.valves.OLLAMA_MODEL, message))
+            raise
+
+    async def _chat(self, ollama_model, message):
+        with self.span("llm"):
+            ollama_result = await self.get_ollama_client().chat(model=ollama_model, messages=[
+                        {
+                            'role': 'user',
+                            'content': message,
+                        },
+                    ])
+        self.record_llm_usage(ollama_model, "chat", ollama_result)
 
         message_reply = ollama_result.get("message").get("content")
         return message_reply
 
-    def get_flask_data(self, pathway, **kwargs):
+    def record_llm_usage(self, ollama_model, mode, ollama_result):
+        # Ollama reports the token counts on a reply, or on the last part of a streamed one.
+        self.metrics.inc("vfx_pipeline_llm_requests_total", model=ollama_model, mode=mode)
+        self.metrics.inc("vfx_pipeline_llm_tokens_total", ollama_result.get("prompt_eval_count") or 0,
+                         model=ollama_model, type="prompt")
+        self.metrics.inc("vfx_pipeline_llm_tokens_total", ollama_result.get("eval_count") or 0,
+                         model=ollama_model, type="completion")
+
+    async def get_flask_data(self, pathway, **kwargs):
         # Connect to Flask API to retrieve data from the server.
         base_url = f"{self.valves.FLASK_HOST}/{pathway}"
         params = None
@@ -97,9 +766,9 @@ class Pipeline:
         flask_data = None
         try:
             if params:
-                response = requests.get(base_url, params=params)
+                response = await self.get_http_client().get(base_url, params=params)
             else:
-                response = requests.get(base_url)
+                response = await self.get_http_client().get(base_url)
             # response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
             flask_data = response.json()
             try:
@@ -107,13 +776,53 @@ class Pipeline:
             except:
                 pass
 
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             error_response = f"An Error occurred: Flask Host: {self.valves.OLLAMA_HOST}, MESSAGE: {str(e)}."
             logging.error(f"Final message: {error_response}")
 
         return flask_data
 
-    def send_post_request(self, pathway, data):
+    async def get_prompt(self, name):
+        # Returns the prompt template text, fetching or revalidating it only when the cached copy is stale.
+        self.prompt_cache.ttl = self.valves.PROMPT_CACHE_TTL
+        content = self.prompt_cache.get(name)
+        if content is not None:
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="prompt", result="hit")
+            return content
+        with self.span("prompt"):
+            return await self.fetch_prompt(name)
+
+    async def fetch_prompt(self, name):
+        # Fetch a prompt, or revalidate the cached copy with its ETag.
+
+        url = f"{self.valves.FLASK_HOST}/{name}"
+        headers = {}
+        etag = self.prompt_cache.etag(name)
+        if etag:
+            headers["If-None-Match"] = etag
+        try:
+            response = await self.get_http_client().get(url, headers=headers)
+            if response.status_code == 304:
+                self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="prompt", result="revalidated")
+                self.prompt_cache.touch(name)
+                return self.prompt_cache.get_stale(name)
+            response.raise_for_status()
+            prompt_data = response.json()
+            if "message" not in prompt_data:
+                raise ValueError(prompt_data.get("error", f"No prompt returned for {name}."))
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="prompt", result="miss")
+            self.prompt_cache.store(name, prompt_data["message"], response.headers.get("ETag"))
+            return prompt_data["message"]
+        except (httpx.HTTPError, ValueError) as e:
+            # Fall back to the last known version rather than failing the whole turn.
+            self.console_log(f"Could not fetch prompt {name} from {url}: {str(e)}", "error")
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="prompt", result="stale")
+            return self.prompt_cache.get_stale(name)
+
+    async def warm_prompt_cache(self):
+        await asyncio.gather(*(self.get_prompt(name) for name in PROMPT_NAMES))
+
+    async def send_post_request(self, pathway, data):
         # Convert your list of strings into JSON format.
         data_json = json.dumps(data)
 
@@ -125,16 +834,55 @@ class Pipeline:
 
         try:
             # Send a POST request with the JSON payload.
-            response = requests.post(url, headers=headers, json=data_json)
+            response = await self.get_http_client().post(url, headers=headers, json=data_json)
 
             # Check if the response was successful (200).
             response.raise_for_status()
 
             return response.json()
 
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             self.console_log(f'"An error occurred:\n" {str(e)}', "error")
 
+    async def post_json(self, pathway, data):
+        # POST data as plain JSON and return the decoded reply, None if the request failed.
+        url = f"{self.valves.FLASK_HOST}/{pathway}"
+        try:
+            response = await self.get_http_client().post(url, json=data)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            self.console_log(f'"An error occurred:\n" {str(e)}', "error")
+
+    async def api_post(self, endpoint, data):
+        # Call create_workspace/get_files_folders/ingest_request/ingest_batch on the configured API version.
+        # Returns the reply as a dict, None if the request failed.
+        if self.valves.API_VERSION == "v2":
+            return await self.post_json(f"v2/{endpoint}", data)
+        reply = await self.send_post_request(endpoint, data=data)
+        if isinstance(reply, str):
+            reply = json.loads(reply)
+        return reply
+
+    async def run_server_job(self, kind, data):
+        # Submit a background job on the FastAPI host and poll it until it finishes, returns the job's result dict.
+        submitted = await self.post_json(f"jobs/{kind}", data)
+        if not submitted:
+            return {"result": False, "error": f"Could not submit the {kind} job."}
+        job_id = submitted["job_id"]
+        deadline = time.monotonic() + self.valves.JOB_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.valves.JOB_POLL_INTERVAL)
+            job = await self.get_flask_data(f"jobs/{job_id}")
+            if not job:
+                continue  # Keep polling through a dropped request.
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] in ("failed", "cancelled"):
+                return {"result": False, "error": job["error"] or f"Job {job_id} was {job['status']}."}
+            self.console_log(f"Job {job_id} ({kind}): {job['status']} {job['progress']}", "info")
+        return {"result": False, "error": f"Job {job_id} did not finish within {self.valves.JOB_TIMEOUT} seconds."}
+
     def console_log(self, message, logging_type):
         if logging_type == "info":
             logging.info(f"{message}")
@@ -151,37 +899,92 @@ class Pipeline:
         elif not self.flask_status:
             return flask_error_msg
 
-    def get_relevance_test(self, message):
+    async def get_relevance_test(self, message):
         # Ask LLM if the request is valid to VFX Pipeline, Returns True if Yes or False if not.
         # First get the Prompt from Remote Server
-        relevance_prompt = self.get_flask_data("relevance_prompt")
+        relevance_prompt = await self.get_prompt("relevance_prompt")
         relevance_prompt_construction = f"{relevance_prompt}{message}"
         # Send to LLM for item.
-        relevance = self.connect_ollama(relevance_prompt_construction)
+        relevance = await self.connect_ollama(relevance_prompt_construction, cache=True)
         return relevance
 
-    def get_user_intent(self, message):
+    async def get_user_intent(self, message):
         # Ask LLM about the users intent to process.
         # First get the Prompt from Remote Server
-        user_intent_prompt = self.get_flask_data("user_intent_prompt")
+        user_intent_prompt = await self.get_prompt("user_intent_prompt")
         user_intent_prompt_construction = f"{user_intent_prompt}{message}"
         # Send to LLM for item.
-        user_intent = self.connect_ollama(user_intent_prompt_construction)
+        user_intent = await self.connect_ollama(user_intent_prompt_construction, cache=True)
         return user_intent
 
-    def setup_task(self, message):
-        # Ask LLM for what Project/Sequence/Shot/Department/Person the SHot is going to be setup for.
-        # Get Prompt from Server
-        setup_prompt = self.get_flask_data("setup_prompt")  # Expects a JSON string back.
-        setup_prompt_construction = f"{setup_prompt} {message}"
-        setup_prompt_data = self.connect_ollama(setup_prompt_construction)
+    async def get_combined_route(self, message):
+        # Ask LLM for relevance and intent in one call. Returns (relevant, intent) or None if the reply can't be used.
+        route_prompt = await self.get_prompt("route_prompt")
+        if route_prompt is None:
+            return None
+        route_prompt_construction = f"{route_prompt}{message}"
+        try:
+            route = await self.connect_ollama_json(route_prompt_construction)
+            relevant = route["relevant"]
+            intent = str(route.get("intent", "unsure")).lower()
+        except (ValueError, TypeError, KeyError) as e:
+            self.console_log(f"Could not parse combined route reply: {str(e)}", "error")
+            self.llm_cache.discard(LLMResponseCache.make_key(self.valves.OLLAMA_MODEL, route_prompt_construction))
+            return None
+        if isinstance(relevant, str):
+            relevant = relevant.lower() == "true"
+        if intent not in USER_INTENTS:
+            intent = "unsure"
+        return bool(relevant), intent
+
+    async def route_message(self, message):
+        # Returns (relevant, intent, fields), intent is None when the message is not relevant to the pipeline.
+        # fields holds task data the pre-router already extracted, None if the task has to ask the LLM.
+        if self.valves.PRE_ROUTER:
+            decision = self.pre_router.classify(message)
+            self.metrics.inc("vfx_pipeline_cache_lookups_total", cache="pre_router",
+                             result="miss" if decision is None else "hit")
+            if decision is not None:
+                print(f"PreRoute: {decision} : <EOF>")
+                return decision["relevant"], decision["intent"], decision["fields"]
+            self.console_log(f"Pre-router unsure, asking LLM. Stats: {self.pre_router.stats()}", "info")
+
+        if self.valves.ROUTING_MODE == "combined":
+            route = await self.get_combined_route(message)
+            if route is not None:
+                print(f"CombinedRoute: {route} : <EOF>")
+                relevant, users_intent = route
+                return relevant, users_intent if relevant else None, None
+            # Fall back to the two step routing if the combined reply was not valid JSON.
 
-        setup_prompt_data = json.loads(setup_prompt_data)
+        relevance_to_pipe = await self.get_relevance_test(message)  # Should Return either a True or False Boolean Value.
+        print(f"PipeRelevance: {relevance_to_pipe} : <EOF>")
+        if "false" in relevance_to_pipe.lower():  # if it is NOT relevant to the Pipe.
+            return False, None, None
+        # Ask the LLM if the User is requesting a Setup Request or an Ingestion Request.
+        users_intent = await self.get_user_intent(message)  # Should return a string of the department or "unsure" if it didnt understand.
+        print(f"UserIntent: {users_intent} : <EOF>")
+        return True, users_intent, None
+
+    async def setup_task(self, message, fields=None):
+        # Ask LLM for what Project/Sequence/Shot/Department/Person the SHot is going to be setup for.
+        # Skipped when the pre-router already extracted the fields.
+        if fields:
+            setup_prompt_data = fields
+        else:
+            # Get Prompt from Server
+            setup_prompt = await self.get_prompt("setup_prompt")
+            setup_prompt_construction = f"{setup_prompt} {message}"
+            setup_prompt_data = await self.connect_ollama_json(setup_prompt_construction)
 
         # Send Data to the Flask Server for setup.
-        post_setup = self.send_post_request("create_workspace", data=setup_prompt_data)
-        # Expect a json object with keys result, destination, template_used, error
-        post_setup_data = json.loads(post_setup)
+        if self.valves.USE_JOB_QUEUE:
+            post_setup_data = await self.run_server_job("create_workspace", setup_prompt_data)
+        else:
+            # Expect a json object with keys result, destination, template_used, error
+            post_setup_data = await self.api_post("create_workspace", setup_prompt_data)
+        if not post_setup_data:
+            post_setup_data = {"result": False, "error": "The create_workspace request failed."}
 
         if post_setup_data["result"]:
             return (f"Successfully Setup for {setup_prompt_data['user']} for the {setup_prompt_data['department']} at "
@@ -190,16 +993,18 @@ class Pipeline:
             return (f"Unable to Setup for {setup_prompt_data['user']} for the {setup_prompt_data['department']}, "
                     f"Something went wrong:\n {post_setup_data['error']}.")
 
-    def ingestion_task(self, message):
+    async def ingestion_task(self, message, fields=None):
         # Ask LLM for what Project/Sequence/Shot/Department/Person the SHot is going to be setup for.
         items_processed = []
 
-        # Get Prompt from Server for What type of Files its trying to ingest and return a dictionary of all items.
-        ingestion_prompt = self.get_flask_data("ingestion_prompt")  # Expects a JSON string back.
-        ingestion_prompt_construction = f"{ingestion_prompt} {message}"
-        ingestion_prompt_data = self.connect_ollama(ingestion_prompt_construction)
-
-        ingestion_prompt_data = json.loads(ingestion_prompt_data)
+        if fields:
+            # The pre-router already extracted the requests.
+            ingestion_prompt_data = fields
+        else:
+            # Get Prompt from Server for What type of Files its trying to ingest and return a dictionary of all items.
+            ingestion_prompt = await self.get_prompt("ingestion_prompt")
+            ingestion_prompt_construction = f"{ingestion_prompt} {message}"
+            ingestion_prompt_data = await self.connect_ollama_json(ingestion_prompt_construction)
         """Example Data
             {
               "request1": {
@@ -222,7 +1027,10 @@ class Pipeline:
               }...
             }
         """
-        # For each item in the JSON lib, Process request.
+        extract_ingestion_info_prompt = await self.get_prompt("extract_ingestion_prompt")
+
+        # For each item in the JSON lib, collect a (search path, folder) job per department to process.
+        ingestion_jobs = []
         if ingestion_prompt_data:
             for key, value in ingestion_prompt_data.items():
                 value_data = value
@@ -231,86 +1039,196 @@ class Pipeline:
                     continue
 
                 # Construct a crude path for files in the project folder to process.
-                # {root_drive_letter}://{project}/{sequence}/{shot}/{ingest}
-                root_drive_letter = "T:\\"
-                path_to_search = os.path.join(root_drive_letter,
-                                              value_data["project"],
-                                              value_data["sequence"],
-                                              value_data["shot"],
-                                              "ingest")
+                # {ingest_root}/{project}/{sequence}/{shot}/ingest
+                path_to_search = self.ingest_path(value_data["project"],
+                                                  value_data["sequence"],
+                                                  value_data["shot"],
+                                                  "ingest")
                 folders_to_search = value_data["ingestion"]  # This is the folder to search for in the directory as a list.
 
                 for folder in folders_to_search:
+                    ingestion_jobs.append((path_to_search, folder))
 
-                    # Iterate over each item and process each department.
-                    json_to_send = json.dumps({"search_path": path_to_search,
-                                               "folders_to_search": folder})
-
-                    # Send Data to the Flask Server for data back.
-                    post_get_files_folders = self.send_post_request("get_files_folders", data=json_to_send)  # Expects JSON string back.
-                    # Check the files returned to see if they are relevant via LLM.
-                    # Expect a message back with the {"search_path": file_path,"files_found": files_data}
-                    # Use LLM to process the JSON to send for Ingestion Request.
-
-                    if isinstance(post_get_files_folders, str):
-                        post_get_files_folders = json.loads(post_get_files_folders)
-
-                    if post_get_files_folders["message"]:
-
-                        extract_ingestion_info_prompt = self.get_flask_data("extract_ingestion_prompt")
-                        extract_ingestion_info_prompt_construction = f"{extract_ingestion_info_prompt} {message}"
-                        extract_ingestion_info_prompt_data = self.connect_ollama(extract_ingestion_info_prompt_construction)
-
-                        extract_ingestion_info_prompt_data = json.loads(extract_ingestion_info_prompt_data)
-
-                        """ Example Data
-                        { 
-                          "project": "PROJ_ABC",
-                          "sequence": "abc11",
-                          "shot": "sh001",
-                          "department": "fx",
-                          "type": "fx",
-                          "is_sequence": true,
-                          "src_path": "T:\\PROJ_ABC\\ingest\\plate",
-                          "extension": "exr",
-                          "naming_scheme": "fx",
-                          "versioning": true,
-                          "user": "pipeline"
-                        }
-                        """
-                        # Process keys here if needed
-
-                        ingestion_request_json = json.dumps(extract_ingestion_info_prompt_data)
-                        # Send request with relevant data to the flask server
-                        post_ingestion_request = self.send_post_request("ingest_request",
-                                                                        data=ingestion_request_json)  # Expects JSON string back.
-                        post_ingestion_request_data = json.loads(post_ingestion_request)
-
-                        if post_ingestion_request_data["result"]:
-                            # Successfull Ingestion
-                            items_processed.append({"destination_path": post_ingestion_request_data["destination_path"],
-                                                    "source_path": post_ingestion_request_data["source_path"],
-                                                    "result": post_ingestion_request_data["result"]
-                                                    })
+        # Each job is a scan -> LLM extraction -> ingest chain, run them in parallel up to INGESTION_CONCURRENCY.
+        # With INGEST_BATCH the chains stop after the extraction and all the ingests go to the server in one request.
+        semaphore = asyncio.Semaphore(max(1, self.valves.INGESTION_CONCURRENCY))
+        batch = self.valves.INGEST_BATCH
+
+        async def run_job(path_to_search, folder):
+            # Returns ("payload", payload) to send with the batch, or ("result", result or None) when done.
+            async with semaphore:
+                try:
+                    payload = await self.extract_ingest_payload(message, extract_ingestion_info_prompt,
+                                                                path_to_search, folder)
+                    if payload is None:
+                        return "result", None
+                    if batch:
+                        return "payload", payload
+                    return "result", await self.submit_ingest(payload)
+                except Exception as e:
+                    # Report the failure for this folder without aborting the rest of the batch.
+                    self.console_log(f"Ingestion of {folder} in {path_to_search} failed: {str(e)}", "error")
+                    return "result", {"source_path": os.path.join(path_to_search, folder), "result": False,
+                                      "error": str(e)}
+
+        # gather keeps the results in the same order as the jobs.
+        jobs = await asyncio.gather(*(run_job(path, folder) for path, folder in ingestion_jobs))
+        if batch:
+            results = await self.submit_ingest_batch(jobs)
+        else:
+            results = [value for _, value in jobs]
+        for result in results:
+            if result is not None:
+                items_processed.append(result)
 
         return items_processed  # Returns a list of dicts.
 
+    def ingest_path(self, *parts):
+        # Join parts under INGEST_ROOT with that root's own separators, whatever OS the pipeline runs on.
+        root = self.valves.INGEST_ROOT
+        if ntpath.splitdrive(root)[0]:
+            return str(PureWindowsPath(root, *parts))
+        return str(PurePosixPath(root, *parts))
+
+    async def extract_ingest_payload(self, message, extract_ingestion_info_prompt, path_to_search, folder):
+        # Scan one department folder and have the LLM build its /ingest_request payload, None if nothing was found.
+        files_request = {"search_path": path_to_search,
+                         "folders_to_search": folder}
+
+        # Send Data to the Flask Server for data back.
+        with self.span("scan"):
+            post_get_files_folders = await self.api_post("get_files_folders", files_request)
+        # Check the files returned to see if they are relevant via LLM.
+        # Expect {"search_path": file_path,"files_found": files_data}, wrapped in "message" by the v1 endpoint.
+        # Use LLM to process the JSON to send for Ingestion Request.
+        if post_get_files_folders and self.valves.API_VERSION != "v2":
+            post_get_files_folders = post_get_files_folders.get("message")
+
+        if not post_get_files_folders or not post_get_files_folders.get("files_found"):
+            return None
+
+        extract_ingestion_info_prompt_construction = f"{extract_ingestion_info_prompt} {message}"
+        with self.span("extract"):
+            extract_ingestion_info_prompt_data = await self.connect_ollama_json(
+                extract_ingestion_info_prompt_construction)
+
+        """ Example Data
+        { 
+          "project": "PROJ_ABC",
+          "sequence": "abc11",
+          "shot": "sh001",
+          "department": "fx",
+          "type": "fx",
+          "is_sequence": true,
+          "src_path": "T:\\PROJ_ABC\\ingest\\plate",
+          "extension": "exr",
+          "naming_scheme": "fx",
+          "versioning": true,
+          "user": "pipeline"
+        }
+        """
+        # Process keys here if needed
+        return extract_ingestion_info_prompt_data
+
+    async def submit_ingest(self, extract_ingestion_info_prompt_data):
+        # Send request with relevant data to the flask server
+        with self.span("ingest"):
+            if self.valves.USE_JOB_QUEUE:
+                # Long ingests run as a server job so the request can't time out.
+                post_ingestion_request_data = await self.run_server_job("ingest", extract_ingestion_info_prompt_data)
+            else:
+                post_ingestion_request_data = await self.api_post("ingest_request", extract_ingestion_info_prompt_data)
+        if not post_ingestion_request_data:
+            post_ingestion_request_data = {"result": False, "error": "The ingest request failed."}
+        self.record_ingest(post_ingestion_request_data)
+
+        return self.ingest_item_result(post_ingestion_request_data, extract_ingestion_info_prompt_data)
+
+    async def submit_ingest_batch(self, jobs):
+        # jobs holds ("payload", payload) per folder to ingest, or ("result", result or None) for the folders that
+        # didn't get that far. Sends the payloads in one /ingest_batch request and returns the results in order.
+        payloads = [value for kind, value in jobs if kind == "payload"]
+        if not payloads:
+            return [value for _, value in jobs]
+        batch_data = {"items": payloads}
+        with self.span("ingest"):
+            if self.valves.USE_JOB_QUEUE:
+                batch_result = await self.run_server_job("ingest_batch", batch_data)
+            else:
+                batch_result = await self.api_post("ingest_batch", batch_data)
+        self.record_ingest(batch_result or {})
+        server_results = iter((batch_result or {}).get("results") or [])
+        error = (batch_result or {}).get("error") or "The ingest batch request failed."
+
+        results = []
+        for kind, value in jobs:
+            if kind != "payload":
+                results.append(value)
+                continue
+            server_result = next(server_results, None) or {"result": False, "error": error}
+            results.append(self.ingest_item_result(server_result, value))
+        return results
+
+    def record_ingest(self, ingest_result):
+        # Files and bytes from the copy_stats of an ingest or batch reply, plus files dedup hardlinked.
+        copy_stats = ingest_result.get("copy_stats") or {}
+        self.metrics.inc("vfx_pipeline_files_ingested_total", copy_stats.get("files", 0), method="copy")
+        self.metrics.inc("vfx_pipeline_bytes_ingested_total", copy_stats.get("bytes", 0), method="copy")
+        results = ingest_result.get("results") or [ingest_result]
+        linked = sum(((result or {}).get("dedup") or {}).get("linked", 0) for result in results)
+        self.metrics.inc("vfx_pipeline_files_ingested_total", linked, method="hardlink")
+
+    @staticmethod
+    def ingest_item_result(post_ingestion_request_data, extract_ingestion_info_prompt_data):
+        if post_ingestion_request_data["result"]:
+            # Successfull Ingestion
+            return {"destination_path": post_ingestion_request_data["destination_path"],
+                    "source_path": post_ingestion_request_data["source_path"],
+                    "result": post_ingestion_request_data["result"]
+                    }
+        return {"source_path": post_ingestion_request_data.get("source_path", extract_ingestion_info_prompt_data.get("src_path")),
+                "result": False,
+                "error": post_ingestion_request_data.get("error")}
+
     def pipe(self, user_message: str, model_id: str, messages: List[dict], body: dict) -> Union[str, Generator, Iterator]:
         # This function is called when a new user_message is received.
+        # The pipelines server runs pipe() on a worker thread, the work itself is done by apipe() on the event loop.
+        result = self.run_coroutine(self.apipe(user_message, model_id, messages, body))
+        if isinstance(result, AsyncIterator):
+            return self.iterate_async(result)
+        return result
 
-        self.console_log("-/-Main Pipe-/-", "info")
+    async def apipe(self, user_message: str, model_id: str, messages: List[dict], body: dict) -> Union[str, AsyncIterator]:
+        # Async version of pipe(), many messages can be in flight on one event loop.
+        # Each turn gets a correlation id that is sent with all of its requests to the FastAPI host, and a trace
+        # of how long each stage took is logged once the reply starts.
+        request_id = uuid.uuid4().hex
+        id_token = correlation_id.set(request_id)
+        spans = []
+        spans_token = turn_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            return await self.handle_message(user_message, model_id, messages, body)
+        finally:
+            seconds = time.perf_counter() - started
+            self.metrics.observe("vfx_pipeline_turn_seconds", seconds)
+            self.console_log(f"[{request_id}] Turn took {seconds * 1000:.1f}ms: {summarise_spans(spans)}", "info")
+            turn_spans.reset(spans_token)
+            correlation_id.reset(id_token)
 
-        # Check for Heartbeat again
-        self.heartbeat()  # Fast API server for the Queries and Ollama Server for LLM.
+    async def handle_message(self, user_message: str, model_id: str, messages: List[dict], body: dict) -> Union[str, AsyncIterator]:
+        # Forwarded and summary replies are returned as an async generator of text chunks when streaming.
+        stream = self.valves.STREAM_RESPONSES and bool((body or {}).get("stream"))
 
-        self.console_log(f"Flask Status: {self.flask_status}", "info")
-        self.console_log(f"Ollama Status: {self.ollama_status}", "info")
+        self.console_log("-/-Main Pipe-/-", "info")
 
         # Init Final Response
         final_response = "..."
 
         # Check if flask and ollama servers are accepting connections, if not exit and return the error codes to user
-        if not self.flask_status or not self.ollama_status:
+        with self.span("health"):
+            servers_ready = await self.servers_ready()
+        if not servers_ready:  # Fast API server for the Queries and Ollama Server for LLM.
             final_response = self.get_server_message()
             self.console_log(f"Error{final_response}", "error")  # log message to logs
             return final_response  # Return early to show errors before going through the rest of pipe.
@@ -318,18 +1236,15 @@ class Pipeline:
         # Start
 
         # Check if the Response is a Valid Query for the VFX Pipeline. If not Forward it to the LLM instead and return its result.
-        relevance_to_pipe = self.get_relevance_test(user_message)  # Should Return either a True or False Boolean Value.
-        print(f"PipeRelevance: {relevance_to_pipe} : <EOF>")
-        if "false" in relevance_to_pipe.lower():  # if it is NOT relevant to the Pipe.
+        with self.span("route"):
+            relevant_to_pipe, users_intent, task_fields = await self.route_message(user_message)
+        if not relevant_to_pipe:  # if it is NOT relevant to the Pipe.
             self.console_log("Forwarding non-relevant reply to LLM.", "info")  # log message to logs
             # Forward Request to the LLM or Cancel.
-            llm_reply = self.connect_ollama(user_message)
+            llm_reply = await self.llm_reply(user_message, stream)
             return llm_reply  # This end Prematurely to avoid executing rest of the code.
         else:
             # If users message is relevant try to process it
-            # Ask the LLM if the User is requesting a Setup Request or an Ingestion Request.
-            users_intent = self.get_user_intent(user_message)  # Should return a string of the department or "unsure" if it didnt understand.
-            print(f"UserIntent: {users_intent} : <EOF>")
             if "unsure" in users_intent:
                 unsure_message = "I'm sorry but I couldn't understand what to process, Can you repeat it clearly once again?"
                 self.console_log(f"Final Response: {unsure_message}", "error")  # log message to logs
@@ -339,18 +1254,20 @@ class Pipeline:
             if "setup" in users_intent:
                 self.console_log("Setup Request Started.", "info")  # log message to logs
                 # Start Setup Request
-                setup_task = self.setup_task(user_message)
+                with self.span("setup"):
+                    setup_task = await self.setup_task(user_message, fields=task_fields)
                 print(f"SetupTask:{setup_task}")
-                llm_reply = self.connect_ollama(f"Can you summarise the following message to a user that can better understand what happened: {setup_task}")
+                llm_reply = await self.llm_reply(f"Can you summarise the following message to a user that can better understand what happened: {setup_task}", stream)
                 return llm_reply
 
             # if the user is requesting an ingestion request
             if "ingestion" in users_intent:
                 # handle ingestion control logic here.
                 self.console_log("Ingestion Request Started.", "info")  # log message to logs
-                ingestion_task = self.ingestion_task(user_message)
+                with self.span("ingestion"):
+                    ingestion_task = await self.ingestion_task(user_message, fields=task_fields)
                 print(f"IngestionTask:{ingestion_task}")
-                llm_reply = self.connect_ollama(f"Can you create a message to the user showing the paths for items that were successfully ingesting into the pipeline? If its empty it means nothing was ingested.: {ingestion_task}")
+                llm_reply = await self.llm_reply(f"Can you create a message to the user showing the paths for items that were successfully ingesting into the pipeline? If its empty it means nothing was ingested.: {ingestion_task}", stream)
                 return llm_reply
 
         # End Result: